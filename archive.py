@@ -0,0 +1,79 @@
+"""Move past bookings out of the live table into the archive table.
+
+    python archive.py                       # uses ARCHIVE_RETENTION_DAYS (365)
+    python archive.py --retention-days 90 --batch-size 5000
+    python archive.py --dry-run
+
+Each batch is copied and deleted in its own short transaction, so the live
+table is never locked for long and an interrupted run can simply be re-run.
+main.py can also run this periodically, see ARCHIVE_INTERVAL_SECONDS.
+"""
+import argparse
+import os
+from datetime import date, timedelta
+
+from sqlalchemy import delete, func, insert, select
+
+DEFAULT_RETENTION_DAYS = 365
+DEFAULT_BATCH_SIZE = 1000
+
+
+def retention_days():
+    return int(os.environ.get("ARCHIVE_RETENTION_DAYS", DEFAULT_RETENTION_DAYS))
+
+
+def archive_cutoff(days=None):
+    """Bookings dated before this day belong in the archive."""
+    return date.today() - timedelta(days=retention_days() if days is None else days)
+
+
+def count_archivable(session_factory, live, cutoff):
+    with session_factory() as db:
+        return db.execute(select(func.count()).select_from(live).where(live.c.booking_date < cutoff)).scalar()
+
+
+def archive_bookings(session_factory, live, archive, cutoff, batch_size=DEFAULT_BATCH_SIZE):
+    """Move rows of `live` dated before `cutoff` into `archive`; returns the count moved."""
+    columns = [column.name for column in live.columns]
+    moved = 0
+    while True:
+        with session_factory() as db:
+            ids = db.execute(
+                select(live.c.id)
+                .where(live.c.booking_date < cutoff)
+                .order_by(live.c.id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                return moved
+            db.execute(
+                insert(archive).from_select(columns, select(*live.c).where(live.c.id.in_(ids)))
+            )
+            db.execute(delete(live).where(live.c.id.in_(ids)))
+            db.commit()
+        moved += len(ids)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive past service bookings")
+    parser.add_argument("--retention-days", type=int, default=None, help="keep this many days of past bookings live")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="only count the bookings that would move")
+    args = parser.parse_args(argv)
+
+    import main as app_module
+
+    app_module.init_db()
+    live = app_module.ServiceBooking.__table__
+    archive = app_module.ServiceBookingArchive.__table__
+    cutoff = archive_cutoff(args.retention_days)
+    if args.dry_run:
+        count = count_archivable(app_module.SessionLocal, live, cutoff)
+        print(f"{count} bookings dated before {cutoff} would be archived")
+        return
+    moved = archive_bookings(app_module.SessionLocal, live, archive, cutoff, args.batch_size)
+    print(f"archived {moved} bookings dated before {cutoff}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+from fastapi import FastAPI, APIRouter, Depends, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from contextlib import asynccontextmanager
+from typing import Optional
+from database import get_settings, make_async_engine
+from models import ServiceBooking, ServiceBookingArchive
+from responses import dumps
+from main import (
+    lifespan as main_lifespan,
+    BOOKING_COLUMNS,
+    ARCHIVE_COLUMNS,
+    booking_not_found,
+    booking_json,
+    json_page,
+    create_booking,
+    update_booking,
+    delete_booking,
+    BookingOut,
+    STREAM_CHUNK_SIZE,
+)
+
+# Async variant of main.py: same table and payloads, with reads served by
+# async def handlers on an AsyncEngine so lookups don't tie up threadpool
+# workers. Writes are main.py's own handlers, so they keep the daily rollup,
+# the capacity check, vehicle_id/customer_id, the caches and the change feed.
+# Run with: uvicorn asyncmain:app
+# Bound to the engine by the lifespan
+async_engine = None
+AsyncSessionLocal = async_sessionmaker(expire_on_commit=False)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global async_engine
+    settings = app.state.settings or get_settings()
+    # main.py's engine, schema checks and write-side state, for the write handlers
+    async with main_lifespan(app):
+        async_engine = make_async_engine(settings)
+        AsyncSessionLocal.configure(bind=async_engine)
+        yield
+        await async_engine.dispose()
+
+
+router = APIRouter()
+
+
+# Dependency
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def fetch_bookings(db, statement):
+    # plain dicts of main.py's public columns, as main.fetch_bookings returns
+    result = await db.execute(statement)
+    keys = [str(key) for key in result.keys()]
+    return [dict(zip(keys, row)) for row in result]
+
+
+async def iter_bookings_ndjson(after_id=None, chunk_size=STREAM_CHUNK_SIZE):
+    # Keyset walk over the primary key with a short-lived session per chunk
+    last_id = after_id or 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            chunk = await fetch_bookings(
+                db,
+                select(*BOOKING_COLUMNS)
+                .where(ServiceBooking.id > last_id)
+                .order_by(ServiceBooking.id)
+                .limit(chunk_size),
+            )
+        if not chunk:
+            return
+        last_id = chunk[-1]["id"]
+        yield b"".join(dumps(booking) + b"\n" for booking in chunk)
+        if len(chunk) < chunk_size:
+            return
+
+
+@router.get("/bookings/get-all/")
+async def get_all_bookings(
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = Query(None, ge=0),
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    if stream:
+        return StreamingResponse(iter_bookings_ndjson(after_id), media_type="application/x-ndjson")
+    query = select(*BOOKING_COLUMNS)
+    if after_id is not None:
+        query = query.where(ServiceBooking.id > after_id)
+    bookings = await fetch_bookings(db, query.order_by(ServiceBooking.id).limit(limit))
+    return json_page(bookings, limit)
+
+
+@router.get("/bookings/{booking_id}", response_model=BookingOut)
+async def get_booking_by_id(booking_id: int, db: AsyncSession = Depends(get_db)):
+    booking = (await db.execute(select(*BOOKING_COLUMNS).where(ServiceBooking.id == booking_id))).first()
+    if not booking:
+        # archived bookings stay readable by id, as in main.py
+        booking = (await db.execute(select(*ARCHIVE_COLUMNS).where(ServiceBookingArchive.id == booking_id))).first()
+    if not booking:
+        raise booking_not_found()
+    return Response(content=booking_json(booking), media_type="application/json")
+
+
+# the sync write handlers from main.py, run in the threadpool
+router.add_api_route("/bookings/", create_booking, methods=["POST"], response_model=BookingOut)
+router.add_api_route("/bookings/{booking_id}", update_booking, methods=["PUT"], response_model=BookingOut)
+router.add_api_route("/bookings/{booking_id}", delete_booking, methods=["DELETE"])
+
+
+def create_app(settings=None):
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+    app.include_router(router)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,62 @@
+import json
+import os
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+# Per-day, per-service_type bay capacity. The counts come from the
+# booking_daily_rollup table (see rollup.py), which every write updates in its
+# own transaction and which refuses to take a slot over capacity, so the limit
+# and GET /availability hold across worker processes. Reading it is
+# O(days x service types) regardless of how many bookings there are.
+#
+#   BAY_CAPACITY=10                          default bays per service type per day
+#   SERVICE_CAPACITY='{"Oil Change": 4}'     per-service overrides
+DEFAULT_BAY_CAPACITY = 10
+
+
+class SlotUnavailable(Exception):
+    def __init__(self, booking_date, service_type):
+        super().__init__(f"No bays available for {service_type} on {booking_date}.")
+        self.booking_date = booking_date
+        self.service_type = service_type
+
+
+class BayCapacity:
+    def __init__(self, default_capacity=DEFAULT_BAY_CAPACITY, capacities=None):
+        self.default_capacity = default_capacity
+        self.capacities = dict(capacities or {})
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            default_capacity=int(os.environ.get("BAY_CAPACITY", DEFAULT_BAY_CAPACITY)),
+            capacities=json.loads(os.environ.get("SERVICE_CAPACITY", "{}")),
+        )
+
+    def capacity(self, service_type):
+        return self.capacities.get(service_type, self.default_capacity)
+
+    def availability(self, counts, date_from, date_to):
+        """Days from date_from to date_to, given (booking_date, service_type, booked) rows."""
+        booked = defaultdict(Counter)
+        for booking_date, service_type, count in counts:
+            booked[booking_date][service_type] += count
+        days = []
+        day = date_from
+        while day <= date_to:
+            day_booked = {service_type: count for service_type, count in booked.get(day, {}).items() if count > 0}
+            service_types = set(day_booked) | set(self.capacities)
+            days.append({
+                "date": day.isoformat(),
+                "default_capacity": self.default_capacity,
+                "service_types": {
+                    service_type: {
+                        "booked": day_booked.get(service_type, 0),
+                        "capacity": self.capacity(service_type),
+                        "remaining": max(self.capacity(service_type) - day_booked.get(service_type, 0), 0),
+                    }
+                    for service_type in sorted(service_types)
+                },
+            })
+            day += timedelta(days=1)
+        return days
@@ -0,0 +1,431 @@
+"""Benchmark harness for the booking APIs.
+
+Seeds a database with synthetic bookings, drives main.py or vehicle.py with a
+concurrent async load generator and writes per-endpoint latency percentiles
+and throughput as JSON, so runs can be diffed between releases.
+
+    python bench.py run --app main --rows 10000 --requests 2000 --output base.json
+    python bench.py run --app vehicle --transport uvicorn --rows 1000000
+    python bench.py compare base.json new.json
+    python bench.py serialize --rows 100000 --limit 1000
+    python bench.py importtime --max-ms 400
+
+The app reads DATABASE_URL at import time, so the benchmark database is set
+through --db before the app module is imported. It defaults to a separate
+file so the real service_center.db is only seeded when asked for explicitly.
+Seeded rows ignore bay capacity, so `run` sets BAY_CAPACITY high unless it
+is already set; otherwise the write endpoints would mostly measure 409s.
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import itertools
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+DEFAULT_DB = "sqlite:///./bench_service_center.db"
+# the app modules live next to this script; subprocesses import them from here
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_TYPES = ("Oil Change", "Tyre Rotation", "Brake Inspection", "General Service", "Wash")
+CUSTOMERS = ("Asha", "Ben", "Chen", "Divya", "Emil", "Farah", "Goran", "Hana")
+SEED_BATCH_SIZE = 10000
+# bays per slot for `run`, far above what the seeded rows fill
+BENCH_BAY_CAPACITY = 1_000_000
+
+# field holding the plate in each app's payload
+PLATE_FIELD = {"main": "vehicle_name", "vehicle": "vehicle_number"}
+
+
+def plate(n):
+    return f"KA{n % 100:02d}X{n:07d}"
+
+
+def synthetic_booking(n, app_name, rng):
+    return {
+        "customer_name": rng.choice(CUSTOMERS),
+        PLATE_FIELD[app_name]: plate(n),
+        "service_type": rng.choice(SERVICE_TYPES),
+        "booking_date": date.today() + timedelta(days=rng.randrange(365)),
+    }
+
+
+def load_app(app_name, database_url):
+    os.environ["DATABASE_URL"] = database_url
+    module = importlib.import_module(app_name)
+    # seeding runs before the app's lifespan would create the engine and tables
+    module.migrate()
+    return module
+
+
+def seed(module, app_name, rows, seed_value=0):
+    # Core executemany in one transaction; the ORM would be far too slow for 1M rows
+    rng = random.Random(seed_value)
+    table = module.ServiceBooking.__table__
+    with module.engine.begin() as conn:
+        conn.execute(table.delete())
+        # the app's lifespan recounts an empty rollup from the seeded rows
+        if hasattr(module, "BookingDailyRollup"):
+            conn.execute(module.BookingDailyRollup.__table__.delete())
+        for start in range(0, rows, SEED_BATCH_SIZE):
+            batch = [
+                synthetic_booking(n, app_name, rng)
+                for n in range(start, min(start + SEED_BATCH_SIZE, rows))
+            ]
+            conn.execute(table.insert(), batch)
+    return existing_ids(module)
+
+
+def existing_ids(module):
+    table = module.ServiceBooking.__table__
+    with module.engine.connect() as conn:
+        return [row[0] for row in conn.execute(table.select().with_only_columns(table.c.id))]
+
+
+def json_booking(n, app_name, rng):
+    booking = synthetic_booking(n, app_name, rng)
+    booking["booking_date"] = booking["booking_date"].isoformat()
+    return booking
+
+
+def scenarios(app_name, ids, rng):
+    """Endpoint name -> factory returning (method, path, params, json body)."""
+    plates = itertools.count(10_000_000)
+    ids_to_delete = iter(ids[len(ids) // 2:][::-1])
+
+    def pick_id():
+        return rng.choice(ids)
+
+    if app_name == "main":
+        list_path = "/bookings/get-all/"
+        update = lambda: ("PUT", f"/bookings/{pick_id()}", None, {"service_type": rng.choice(SERVICE_TYPES)})
+    else:
+        list_path = "/bookings/"
+        update = lambda: ("PUT", f"/bookings/{pick_id()}", None, json_booking(next(plates), app_name, rng))
+
+    endpoints = {
+        "POST /bookings/": lambda: ("POST", "/bookings/", None, json_booking(next(plates), app_name, rng)),
+        f"GET {list_path}": lambda: ("GET", list_path, {"limit": 100, "after_id": pick_id()}, None),
+        "GET /bookings/{booking_id}": lambda: ("GET", f"/bookings/{pick_id()}", None, None),
+        "PUT /bookings/{booking_id}": update,
+        "DELETE /bookings/{booking_id}": lambda: ("DELETE", f"/bookings/{next(ids_to_delete)}", None, None),
+    }
+    if app_name == "main":
+        endpoints["GET /bookings/search"] = lambda: (
+            "GET", "/bookings/search", {"service_type": rng.choice(SERVICE_TYPES), "from": date.today().isoformat(), "limit": 50}, None,
+        )
+    return endpoints
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0] if latencies else 0.0
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(p50 * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+        "p99_ms": round(p99 * 1000, 3),
+    }
+
+
+async def drive(client, make_request, total, concurrency):
+    import httpx
+
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            method, path, params, body = make_request()
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, params=params, json=body)
+            except httpx.TransportError:
+                # e.g. a keep-alive connection the server had just closed; counted, not fatal
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def run_load(base_url, transport, endpoints, requests_per_endpoint, concurrency, app=None):
+    import httpx
+
+    # ASGITransport doesn't send lifespan events, so run startup/shutdown here
+    lifespan = app.router.lifespan_context(app) if app is not None else contextlib.nullcontext()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with lifespan, httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=60) as client:
+        results = {}
+        for name, make_request in endpoints.items():
+            results[name] = await drive(client, make_request, requests_per_endpoint, concurrency)
+            print(f"{name}: {results[name]}", file=sys.stderr)
+        return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_uvicorn(app_name, port):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{app_name}:app", "--port", str(port), "--log-level", "warning"],
+        env=os.environ.copy(), cwd=APP_DIR,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return server
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start")
+
+
+def cmd_run(args):
+    import httpx
+
+    # read when the app is imported, and inherited by the uvicorn process
+    os.environ.setdefault("BAY_CAPACITY", str(BENCH_BAY_CAPACITY))
+    module = load_app(args.app, args.db)
+    if args.rows:
+        print(f"seeding {args.rows} bookings", file=sys.stderr)
+    ids = seed(module, args.app, args.rows) if args.rows else existing_ids(module)
+    if not ids:
+        raise SystemExit("the benchmark database is empty, pass --rows to seed it")
+    endpoints = scenarios(args.app, ids, random.Random(1))
+    if args.endpoint:
+        endpoints = {name: endpoints[name] for name in args.endpoint}
+
+    server = None
+    if args.transport == "asgi":
+        app = module.app
+        base_url, transport = "http://bench", httpx.ASGITransport(app=app)
+    else:
+        port = free_port()
+        server = start_uvicorn(args.app, port)
+        app = None
+        base_url, transport = f"http://127.0.0.1:{port}", None
+    try:
+        results = asyncio.run(run_load(base_url, transport, endpoints, args.requests, args.concurrency, app))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "meta": {
+            "app": args.app,
+            "transport": args.transport,
+            "rows": len(ids),
+            "requests_per_endpoint": args.requests,
+            "concurrency": args.concurrency,
+            "python": sys.version.split()[0],
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    write_report(report, args.output)
+
+
+def write_report(report, output):
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def cmd_seed(args):
+    module = load_app(args.app, args.db)
+    ids = seed(module, args.app, args.rows)
+    print(f"seeded {len(ids)} bookings into {args.db}")
+
+
+def time_calls(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, 0, sum(samples))
+
+
+def cmd_serialize(args):
+    # GET /bookings/get-all/ page rendering: ORM objects through jsonable_encoder
+    # (the old handler) against Core row tuples through FastJSONResponse
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    module = load_app("main", args.db)
+    ids = seed(module, "main", args.rows) if args.rows else existing_ids(module)
+    after_ids = random.Random(2).choices(ids, k=args.iterations)
+    db = module.SessionLocal()
+    calls = iter(itertools.cycle(after_ids))
+
+    def orm_path():
+        after_id = next(calls)
+        bookings = (
+            db.query(module.ServiceBooking)
+            .filter(module.ServiceBooking.id > after_id)
+            .order_by(module.ServiceBooking.id)
+            .limit(args.limit)
+            .all()
+        )
+        JSONResponse(jsonable_encoder(bookings)).body
+        db.expunge_all()
+
+    def row_path():
+        module.json_page(module.fetch_booking_page(db, next(calls), args.limit), args.limit).body
+
+    try:
+        results = {
+            "orm_jsonable_encoder": time_calls(orm_path, args.iterations),
+            "core_rows_fast_json": time_calls(row_path, args.iterations),
+        }
+    finally:
+        db.close()
+    old, new = results["orm_jsonable_encoder"]["p50_ms"], results["core_rows_fast_json"]["p50_ms"]
+    report = {
+        "meta": {"rows": len(ids), "limit": args.limit, "iterations": args.iterations, "python": sys.version.split()[0]},
+        "results": results,
+        "p50_speedup": round(old / new, 2) if new else None,
+    }
+    write_report(report, args.output)
+
+
+def parse_importtime(stderr):
+    """-X importtime output as {module: (self_us, cumulative_us)}."""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def cmd_importtime(args):
+    # fresh interpreters, so nothing is cached in sys.modules; the database
+    # points into an empty directory to catch imports that touch it
+    with tempfile.TemporaryDirectory() as scratch:
+        db_path = os.path.join(scratch, "import_check.db")
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}")
+        results = {}
+        for app_name in args.app:
+            samples = []
+            timings = {}
+            for _ in range(args.runs):
+                proc = subprocess.run(
+                    [sys.executable, "-X", "importtime", "-c", f"import {app_name}"],
+                    env=env, cwd=APP_DIR, capture_output=True, text=True, check=True,
+                )
+                timings = parse_importtime(proc.stderr)
+                samples.append(timings[app_name][1] / 1000)
+            heaviest = sorted(timings.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+            results[app_name] = {
+                "import_ms_median": round(statistics.median(samples), 2),
+                "import_ms_min": round(min(samples), 2),
+                "touched_database": os.path.exists(db_path),
+                "heaviest_self_ms": {name: round(self_us / 1000, 2) for name, (self_us, _) in heaviest},
+            }
+            print(f"{app_name}: {results[app_name]['import_ms_median']} ms", file=sys.stderr)
+    write_report({"meta": {"runs": args.runs, "python": sys.version.split()[0]}, "results": results}, args.output)
+    failures = [
+        name for name, result in results.items()
+        if result["touched_database"] or (args.max_ms and result["import_ms_median"] > args.max_ms)
+    ]
+    if failures:
+        raise SystemExit(f"import check failed for: {', '.join(failures)}")
+
+
+def cmd_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(args.candidate) as f:
+        candidate = json.load(f)["results"]
+    for name in sorted(set(baseline) & set(candidate)):
+        print(name)
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            old, new = baseline[name][metric], candidate[name][metric]
+            change = (new - old) / old * 100 if old else 0.0
+            print(f"  {metric:>15}: {old:>10} -> {new:>10} ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Booking API benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="seed and load-test an app")
+    run.add_argument("--app", choices=sorted(PLATE_FIELD), default="main")
+    run.add_argument("--db", default=DEFAULT_DB, help="database URL to seed and serve")
+    run.add_argument("--rows", type=int, default=10000, help="bookings to seed, 0 to reuse the existing data")
+    run.add_argument("--requests", type=int, default=1000, help="requests per endpoint")
+    run.add_argument("--concurrency", type=int, default=32)
+    run.add_argument("--transport", choices=("asgi", "uvicorn"), default="asgi")
+    run.add_argument("--endpoint", action="append", help="only run this endpoint, may be repeated")
+    run.add_argument("--output", help="write the JSON report here instead of stdout")
+    run.set_defaults(func=cmd_run)
+
+    seed_cmd = commands.add_parser("seed", help="only seed the database")
+    seed_cmd.add_argument("--app", choices=sorted(PLATE_FIELD), default="main")
+    seed_cmd.add_argument("--db", default=DEFAULT_DB)
+    seed_cmd.add_argument("--rows", type=int, default=10000)
+    seed_cmd.set_defaults(func=cmd_seed)
+
+    serialize = commands.add_parser("serialize", help="old vs new get-all serialization path")
+    serialize.add_argument("--db", default=DEFAULT_DB)
+    serialize.add_argument("--rows", type=int, default=10000, help="bookings to seed, 0 to reuse the existing data")
+    serialize.add_argument("--limit", type=int, default=1000, help="page size")
+    serialize.add_argument("--iterations", type=int, default=200)
+    serialize.add_argument("--output")
+    serialize.set_defaults(func=cmd_serialize)
+
+    importtime = commands.add_parser("importtime", help="cold import time of the app modules")
+    importtime.add_argument("--app", action="append", help="module to import, may be repeated (default: all apps)")
+    importtime.add_argument("--runs", type=int, default=5)
+    importtime.add_argument("--top", type=int, default=10, help="list this many heaviest modules")
+    importtime.add_argument("--max-ms", type=float, default=None,
+                            help="fail when an app's median import time is above this")
+    importtime.add_argument("--output")
+    importtime.set_defaults(func=cmd_importtime)
+
+    compare = commands.add_parser("compare", help="diff two JSON reports")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    if args.command == "importtime" and not args.app:
+        args.app = ["main", "vehicle", "asyncmain"]
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
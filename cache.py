@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+
+try:
+    import redis
+except ImportError:  # optional, only needed for redis:// cache URLs
+    redis = None
+
+# Cache of serialized booking payloads (JSON bytes) keyed by booking id.
+# Backends share get/get_many/set/add/delete/stats so the app doesn't care which one it has:
+#   memory://?maxsize=10000&ttl=60   per-process LRU with TTL (default)
+#   redis://localhost:6379/0?ttl=60  shared between uvicorn workers
+DEFAULT_CACHE_URL = "memory://"
+DEFAULT_MAXSIZE = 10000
+DEFAULT_TTL = 60.0
+
+
+class LRUCache:
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_many(self, keys):
+        """Values for keys in order, None for each miss."""
+        with self._lock:
+            now = time.monotonic()
+            values = []
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None or entry[0] < now:
+                    if entry is not None:
+                        del self._data[key]
+                    self.misses += 1
+                    values.append(None)
+                else:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    values.append(entry[1])
+            return values
+
+    def set(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def add(self, key, value):
+        """Set key only if it isn't cached, so a read-through fill never replaces a write."""
+        # checked and stored under one lock, or a set() could land in between
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                return False
+            self._store(key, value)
+            return True
+
+    def _store(self, key, value):
+        # caller holds _lock
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class RedisCache:
+    def __init__(self, url, ttl=DEFAULT_TTL, prefix="booking:"):
+        if redis is None:
+            raise RuntimeError("redis:// cache URLs need the 'redis' package installed")
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(f"{self.prefix}{key}")
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get_many(self, keys):
+        # one MGET round trip for the whole list
+        if not keys:
+            return []
+        values = self._client.mget([f"{self.prefix}{key}" for key in keys])
+        misses = values.count(None)
+        self.misses += misses
+        self.hits += len(values) - misses
+        return values
+
+    def set(self, key, value):
+        self._client.set(f"{self.prefix}{key}", value, px=int(self.ttl * 1000))
+
+    def add(self, key, value):
+        return bool(self._client.set(f"{self.prefix}{key}", value, px=int(self.ttl * 1000), nx=True))
+
+    def delete(self, key):
+        self._client.delete(f"{self.prefix}{key}")
+
+    def clear(self):
+        keys = list(self._client.scan_iter(f"{self.prefix}*"))
+        if keys:
+            self._client.delete(*keys)
+
+    def stats(self):
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
+
+
+def make_cache(url=None):
+    url = url or os.environ.get("BOOKING_CACHE_URL", DEFAULT_CACHE_URL)
+    parts = urlsplit(url)
+    options = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+    ttl = float(options.pop("ttl", DEFAULT_TTL))
+    if parts.scheme == "memory":
+        return LRUCache(maxsize=int(options.get("maxsize", DEFAULT_MAXSIZE)), ttl=ttl)
+    if parts.scheme in ("redis", "rediss"):
+        return RedisCache(parts._replace(query="").geturl(), ttl=ttl)
+    raise ValueError(f"Unsupported cache URL: {url}")
@@ -0,0 +1,148 @@
+"""Scriptable client for the booking APIs.
+
+Used by request.py and ruppeshrequest.py when they are given arguments:
+
+    python request.py create --file bookings.csv --concurrency 16
+    python request.py update --file changes.ndjson
+    python request.py delete 12 13 14
+    python request.py get 12 13
+    python request.py list > all.ndjson
+
+Records are read from CSV (header row) or NDJSON files, '-' meaning stdin.
+For update and delete each record needs an "id" field. Results are printed
+as NDJSON on stdout and a throughput summary on stderr.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# creates carry an Idempotency-Key, which main.py, vehicle.py and
+# ruppeshmain.py all honour, so a retried POST can't double-book
+RETRY_METHODS = frozenset({"GET", "POST", "PUT", "PATCH", "DELETE"})
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def make_session(pool_size=10, retries=3, backoff=0.2):
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=RETRY_METHODS,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def read_records(path):
+    f = sys.stdin if path == "-" else open(path, newline="")
+    try:
+        if path.endswith(".csv"):
+            # drop empty cells so partial updates only send the given fields
+            return [{key: value for key, value in row.items() if value} for row in csv.DictReader(f)]
+        return [json.loads(line) for line in f if line.strip()]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def build_request(command, base_url, record):
+    if command == "create":
+        return "POST", f"{base_url}/bookings/", record
+    if command == "get":
+        return "GET", f"{base_url}/bookings/{record['id']}", None
+    if command == "delete":
+        return "DELETE", f"{base_url}/bookings/{record['id']}", None
+    fields = {key: value for key, value in record.items() if key != "id"}
+    return "PUT", f"{base_url}/bookings/{record['id']}", fields
+
+
+def send(session, command, base_url, record, timeout):
+    method, url, body = build_request(command, base_url, record)
+    # one key per record; urllib3 resends it unchanged on every retry
+    headers = {"Idempotency-Key": str(uuid.uuid4())} if method == "POST" else None
+    try:
+        response = session.request(method, url, json=body, headers=headers, timeout=timeout)
+    except requests.RequestException as e:
+        return {"record": record, "ok": False, "error": str(e)}
+    try:
+        payload = response.json()
+    except ValueError:
+        payload = None
+    return {"record": record, "ok": response.ok, "status": response.status_code, "response": payload}
+
+
+def run_batch(session, command, base_url, records, concurrency, timeout):
+    start = time.perf_counter()
+    ok = failed = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = pool.map(lambda record: send(session, command, base_url, record, timeout), records)
+        for result in results:
+            print(json.dumps(result))
+            if result["ok"]:
+                ok += 1
+            else:
+                failed += 1
+    elapsed = time.perf_counter() - start
+    rate = (ok + failed) / elapsed if elapsed else 0.0
+    print(f"{command}: {ok} ok, {failed} failed in {elapsed:.2f}s ({rate:.1f} req/s)", file=sys.stderr)
+    return failed
+
+
+def list_bookings(session, base_url, timeout, page_size=1000):
+    start = time.perf_counter()
+    count = 0
+    params = {"limit": page_size}
+    while True:
+        response = session.get(f"{base_url}/bookings/get-all/", params=params, timeout=timeout)
+        response.raise_for_status()
+        for booking in response.json():
+            print(json.dumps(booking))
+            count += 1
+        next_after_id = response.headers.get("X-Next-After-Id")
+        if not next_after_id:
+            break
+        params["after_id"] = next_after_id
+    elapsed = time.perf_counter() - start
+    print(f"list: {count} bookings in {elapsed:.2f}s", file=sys.stderr)
+    return 0
+
+
+def main(argv, base_url):
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument("--base-url", default=base_url)
+    options.add_argument("--concurrency", type=int, default=8)
+    options.add_argument("--retries", type=int, default=3)
+    options.add_argument("--backoff", type=float, default=0.2, help="retry backoff factor in seconds")
+    options.add_argument("--timeout", type=float, default=10.0)
+    parser = argparse.ArgumentParser(description="Vehicle Service Centre API client")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command in ("create", "update"):
+        sub = commands.add_parser(command, parents=[options])
+        sub.add_argument("--file", required=True, help="CSV or NDJSON records, '-' for stdin")
+    for command in ("get", "delete"):
+        sub = commands.add_parser(command, parents=[options])
+        sub.add_argument("ids", nargs="*")
+        sub.add_argument("--file", help="CSV or NDJSON records with an id field")
+    commands.add_parser("list", parents=[options])
+    args = parser.parse_args(argv)
+
+    session = make_session(pool_size=args.concurrency, retries=args.retries, backoff=args.backoff)
+    base = args.base_url.rstrip("/")
+    if args.command == "list":
+        return list_bookings(session, base, args.timeout)
+    records = read_records(args.file) if args.file else []
+    records += [{"id": booking_id} for booking_id in getattr(args, "ids", None) or []]
+    failed = run_batch(session, args.command, base, records, args.concurrency, args.timeout)
+    return 1 if failed else 0
@@ -0,0 +1,230 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+from sqlalchemy.schema import CreateColumn, CreateTable
+
+from metrics import DB_POOL_WAIT, DB_SESSIONS_OPEN
+from query_log import instrument_engine
+
+# Shared engine factory for main.py, vehicle.py, ruppeshmain.py and asyncmain.py.
+# Everything is read from the environment so deployments can tune it without
+# code changes, e.g.
+#   DATABASE_URL=sqlite:///./service_center.db DB_POOL_SIZE=10 uvicorn main:app
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass
+class Settings:
+    database_url: str = "sqlite:///./service_center.db"
+    echo: bool = False
+    pool_size: int = 10
+    max_overflow: int = 20
+    pool_timeout: float = 30.0
+    pool_recycle: int = 3600
+    # SQLite pragmas applied to every new connection
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    mmap_size: int = 256 * 1024 * 1024
+    cache_size: int = -64000  # negative means KiB, so ~64MB
+    busy_timeout: int = 5000  # ms
+    # query instrumentation, see query_log.py
+    slow_query_ms: float = 100.0
+    query_sample_rate: float = 0.0
+    # create/alter tables on import; serve.py turns this off and migrates once
+    auto_migrate: bool = True
+    # main.py writes committed in batches by one writer thread, see writebatch.py
+    group_commit: bool = False
+    group_commit_max_batch: int = 64
+    group_commit_delay_ms: float = 2.0
+
+    @classmethod
+    def from_env(cls):
+        defaults = cls()
+        return cls(
+            database_url=os.environ.get("DATABASE_URL", defaults.database_url),
+            echo=_env_bool("DB_ECHO", defaults.echo),
+            pool_size=int(os.environ.get("DB_POOL_SIZE", defaults.pool_size)),
+            max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", defaults.max_overflow)),
+            pool_timeout=float(os.environ.get("DB_POOL_TIMEOUT", defaults.pool_timeout)),
+            pool_recycle=int(os.environ.get("DB_POOL_RECYCLE", defaults.pool_recycle)),
+            journal_mode=os.environ.get("SQLITE_JOURNAL_MODE", defaults.journal_mode),
+            synchronous=os.environ.get("SQLITE_SYNCHRONOUS", defaults.synchronous),
+            mmap_size=int(os.environ.get("SQLITE_MMAP_SIZE", defaults.mmap_size)),
+            cache_size=int(os.environ.get("SQLITE_CACHE_SIZE", defaults.cache_size)),
+            busy_timeout=int(os.environ.get("SQLITE_BUSY_TIMEOUT", defaults.busy_timeout)),
+            slow_query_ms=float(os.environ.get("SQL_SLOW_QUERY_MS", defaults.slow_query_ms)),
+            query_sample_rate=float(os.environ.get("SQL_LOG_SAMPLE_RATE", defaults.query_sample_rate)),
+            auto_migrate=_env_bool("AUTO_MIGRATE", defaults.auto_migrate),
+            group_commit=_env_bool("GROUP_COMMIT", defaults.group_commit),
+            group_commit_max_batch=int(os.environ.get("GROUP_COMMIT_MAX_BATCH", defaults.group_commit_max_batch)),
+            group_commit_delay_ms=float(os.environ.get("GROUP_COMMIT_DELAY_MS", defaults.group_commit_delay_ms)),
+        )
+
+    @property
+    def is_sqlite(self):
+        return make_url(self.database_url).get_backend_name() == "sqlite"
+
+    @property
+    def is_memory(self):
+        database = make_url(self.database_url).database
+        return not database or database == ":memory:"
+
+    @property
+    def async_database_url(self):
+        url = make_url(self.database_url)
+        if url.get_backend_name() == "sqlite" and url.get_driver_name() != "aiosqlite":
+            url = url.set(drivername="sqlite+aiosqlite")
+        return url.render_as_string(hide_password=False)
+
+
+def get_settings():
+    return Settings.from_env()
+
+
+class _TimedCheckout:
+    # records how long each checkout waited for a connection
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - start)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def _engine_kwargs(settings, poolclass=TimedQueuePool):
+    kwargs = {"echo": settings.echo}
+    if settings.is_sqlite:
+        kwargs["connect_args"] = {"check_same_thread": False}
+    # in-memory SQLite gets one connection shared by every thread; the default
+    # SingletonThreadPool would give each thread its own empty database
+    if settings.is_memory:
+        kwargs["poolclass"] = StaticPool
+    else:
+        kwargs.update(
+            poolclass=poolclass,
+            pool_size=settings.pool_size,
+            max_overflow=settings.max_overflow,
+            pool_timeout=settings.pool_timeout,
+            pool_recycle=settings.pool_recycle,
+        )
+    return kwargs
+
+
+def _install_sqlite_pragmas(sync_engine, settings):
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if not settings.is_memory:
+                cursor.execute(f"PRAGMA journal_mode={settings.journal_mode}")
+                cursor.execute(f"PRAGMA mmap_size={int(settings.mmap_size)}")
+            cursor.execute(f"PRAGMA synchronous={settings.synchronous}")
+            cursor.execute(f"PRAGMA cache_size={int(settings.cache_size)}")
+            cursor.execute(f"PRAGMA busy_timeout={int(settings.busy_timeout)}")
+        finally:
+            cursor.close()
+
+
+def make_engine(settings=None):
+    settings = settings or get_settings()
+    engine = create_engine(settings.database_url, **_engine_kwargs(settings))
+    if settings.is_sqlite:
+        _install_sqlite_pragmas(engine, settings)
+    instrument_engine(engine, settings.slow_query_ms, settings.query_sample_rate)
+    return engine
+
+
+def sync_schema(metadata, engine):
+    # create_all only builds new tables, so columns and indexes added to an
+    # existing table are created here as well. New columns on existing tables
+    # must be nullable or have a server_default.
+    metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    for table in metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        with engine.begin() as conn:
+            for column in table.columns:
+                if column.name not in columns:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine, checkfirst=True)
+
+
+
+def sqlite_table_sql(engine, name):
+    """The CREATE TABLE statement SQLite stored for a table, or None."""
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name}
+        ).scalar()
+
+
+def rebuild_table(engine, table):
+    # For changes ALTER TABLE can't make on SQLite, like dropping a UNIQUE or
+    # adding AUTOINCREMENT: create the table afresh under a temporary name,
+    # copy the rows, drop the old one and rename. Indexes go with the old
+    # table and are created again at the end.
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    columns = ", ".join(column.name for column in table.columns if column.name in existing)
+    staging = f"{table.name}__rebuild"
+    ddl = str(CreateTable(table).compile(dialect=engine.dialect))
+    ddl = ddl.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {staging} ", 1)
+    with engine.begin() as conn:
+        conn.execute(text(ddl))
+        conn.execute(text(f"INSERT INTO {staging} ({columns}) SELECT {columns} FROM {table.name}"))
+        conn.execute(text(f"DROP TABLE {table.name}"))
+        conn.execute(text(f"ALTER TABLE {staging} RENAME TO {table.name}"))
+        for index in table.indexes:
+            index.create(bind=conn)
+
+async def drain_sessions(engine, timeout=30.0, interval=0.05):
+    """Wait for open request sessions to close, then dispose the pool; for lifespan shutdown."""
+    deadline = time.monotonic() + timeout
+    sessions = DB_SESSIONS_OPEN.labels()
+    while sessions.value > 0 and time.monotonic() < deadline:
+        await asyncio.sleep(interval)
+    engine.dispose()
+    return sessions.value
+
+
+# dialects with INSERT ... ON CONFLICT, used for upserts
+UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def upsert_insert(bind, table):
+    """Dialect insert() for table that supports on_conflict_do_update/do_nothing."""
+    return UPSERTS[bind.dialect.name](table)
+
+
+def make_async_engine(settings=None):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    settings = settings or get_settings()
+    engine = create_async_engine(settings.async_database_url, **_engine_kwargs(settings, TimedAsyncQueuePool))
+    if settings.is_sqlite:
+        _install_sqlite_pragmas(engine.sync_engine, settings)
+    instrument_engine(engine.sync_engine, settings.slow_query_ms, settings.query_sample_rate)
+    return engine
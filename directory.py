@@ -0,0 +1,126 @@
+import re
+import threading
+
+from sqlalchemy import bindparam, or_, select, update
+
+from database import upsert_insert
+
+# Normalized vehicle and customer entities for main.py. Bookings keep their
+# raw vehicle_name/customer_name and point at the entity through an indexed
+# foreign key. Each Directory keeps the whole normalized key -> id map in
+# memory (plates are short, so even a million vehicles is tens of MB), which
+# makes plate lookups at the service desk a dict lookup.
+
+# rows read per backfill batch
+BACKFILL_BATCH_SIZE = 5000
+# keys per IN (...) when resolving in bulk, below SQLite's variable limit
+RESOLVE_CHUNK_SIZE = 500
+
+
+def normalize_plate(value):
+    # "ka-01 ab 1234" and "KA01AB1234" are the same vehicle
+    return re.sub(r"[^0-9A-Z]", "", value.upper())
+
+
+def normalize_name(value):
+    return " ".join(value.split()).casefold()
+
+
+class Directory:
+    def __init__(self, table, key, normalize, session_factory):
+        self.table = table
+        self.key = table.c[key]
+        self.normalize = normalize
+        self.session_factory = session_factory
+        self._ids = {}
+        self._lock = threading.Lock()
+        # set to GroupCommitWriter.submit so new entities don't contend with it for the write lock
+        self.submit = None
+
+    def load(self):
+        """Fill the in-memory map from the table; for the lifespan."""
+        with self.session_factory() as db:
+            ids = dict(db.execute(select(self.key, self.table.c.id)).all())
+        with self._lock:
+            self._ids = ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def lookup(self, value):
+        """Id for a raw plate or name, or None if it was never booked."""
+        key = self.normalize(value)
+        entity_id = self._ids.get(key)
+        if entity_id is None:
+            # another worker may have added it since load()
+            with self.session_factory() as db:
+                entity_id = db.execute(select(self.table.c.id).where(self.key == key)).scalar()
+            if entity_id is not None:
+                self._ids[key] = entity_id
+        return entity_id
+
+    def resolve(self, value):
+        return self.resolve_many([value])[0]
+
+    def resolve_many(self, values):
+        """Ids for raw values, creating missing entities."""
+        keys = [self.normalize(value) for value in values]
+        missing = {key for key in keys if key not in self._ids}
+        if missing:
+            self._create(missing)
+        return [self._ids[key] for key in keys]
+
+    def _create(self, keys):
+        # committed on their own, before the booking write, so the map never
+        # holds ids from a rolled-back transaction; an unused entity is harmless
+        keys = sorted(keys)
+
+        def write(db):
+            found = {}
+            statement = upsert_insert(db.get_bind(), self.table).on_conflict_do_nothing(index_elements=[self.key])
+            db.execute(statement, [{self.key.name: key} for key in keys])
+            for start in range(0, len(keys), RESOLVE_CHUNK_SIZE):
+                chunk = keys[start:start + RESOLVE_CHUNK_SIZE]
+                found.update(db.execute(select(self.key, self.table.c.id).where(self.key.in_(chunk))).all())
+            return found
+
+        if self.submit is not None:
+            found = self.submit(write)
+        else:
+            with self.session_factory() as db:
+                found = write(db)
+                db.commit()
+        with self._lock:
+            self._ids.update(found)
+
+
+def backfill(session_factory, table, vehicles, customers, batch_size=BACKFILL_BATCH_SIZE):
+    """Set vehicle_id/customer_id on rows that don't have them; returns the count."""
+    filled = 0
+    last_id = 0
+    while True:
+        with session_factory() as db:
+            rows = db.execute(
+                select(table.c.id, table.c.vehicle_name, table.c.customer_name)
+                .where(table.c.id > last_id, or_(table.c.vehicle_id.is_(None), table.c.customer_id.is_(None)))
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+        if not rows:
+            return filled
+        # resolved between the read and the write, so each transaction stays short
+        vehicle_ids = vehicles.resolve_many([row.vehicle_name for row in rows])
+        customer_ids = customers.resolve_many([row.customer_name for row in rows])
+        with session_factory() as db:
+            db.execute(
+                update(table)
+                .where(table.c.id == bindparam("row_id"))
+                .values(vehicle_id=bindparam("new_vehicle_id"), customer_id=bindparam("new_customer_id")),
+                [
+                    {"row_id": row.id, "new_vehicle_id": vehicle_id, "new_customer_id": customer_id}
+                    for row, vehicle_id, customer_id in zip(rows, vehicle_ids, customer_ids)
+                ],
+            )
+            db.commit()
+        filled += len(rows)
+        last_id = rows[-1].id
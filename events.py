@@ -0,0 +1,86 @@
+import asyncio
+import itertools
+import threading
+from collections import deque
+
+# In-process change feed for bookings. Every write publishes a delta with a
+# sequence number into a fixed-size ring buffer. Subscribers don't get their
+# own queues: each one keeps a cursor into the ring and pulls events as fast
+# as it can send them, so a slow client costs nothing but its cursor. A
+# client that falls further behind than the ring holds, or resumes with an
+# id from before a restart, gets a "reset" event and has to refetch, instead
+# of the server buffering for it.
+DEFAULT_CAPACITY = 4096
+# events handed to a subscriber per wakeup, so one client can't hog the loop
+MAX_BATCH = 256
+
+
+class EventBus:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self._events = deque(maxlen=capacity)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+
+    def bind(self, loop):
+        """Attach to the event loop subscribers run on; publish() may run on any thread."""
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def publish(self, kind, booking):
+        self.publish_many(kind, [booking])
+
+    def publish_many(self, kind, bookings):
+        with self._lock:
+            for booking in bookings:
+                self._seq += 1
+                self._events.append({"seq": self._seq, "type": kind, "booking": booking})
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._notify)
+
+    def _notify(self):
+        # wake everyone waiting on the current event and start a fresh one
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    def since(self, seq, limit=MAX_BATCH):
+        """Events after seq, plus whether events between seq and the ring were lost."""
+        with self._lock:
+            if seq > self._seq:
+                # a Last-Event-ID from before a restart: the sequence started over
+                return [], True
+            if not self._events or seq == self._seq:
+                return [], False
+            first = self._events[0]["seq"]
+            lost = seq < first - 1
+            start = 0 if lost else seq - first + 1
+            return list(itertools.islice(self._events, start, start + limit)), lost
+
+    async def subscribe(self, last_seq=None, heartbeat=15.0):
+        """Yield events after last_seq (default: only new ones); None means heartbeat."""
+        if self._loop is None:
+            self.bind(asyncio.get_running_loop())
+        if last_seq is None:
+            last_seq = self._seq
+        while True:
+            # grab the wakeup before reading so a publish in between isn't missed
+            wakeup = self._wakeup
+            events, lost = self.since(last_seq)
+            if lost:
+                last_seq = self._seq
+                yield {"seq": last_seq, "type": "reset", "booking": None}
+                continue
+            for event in events:
+                yield event
+                last_seq = event["seq"]
+            if events:
+                continue
+            try:
+                await asyncio.wait_for(wakeup.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
@@ -0,0 +1,142 @@
+import csv
+import io
+import zlib
+from datetime import date
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional, only needed for format=parquet
+    pyarrow = None
+
+from responses import dumps
+
+# Streaming bulk exports for GET /bookings/export. Rows are read from a
+# server-side cursor in partitions of EXPORT_CHUNK_SIZE as plain Core rows,
+# never ORM objects, and each partition is encoded and sent before the next
+# one is fetched, so memory stays flat however many bookings are exported.
+
+EXPORT_CHUNK_SIZE = 5000
+# wbits for a gzip container around the deflate stream
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class ExportFormatUnavailable(Exception):
+    pass
+
+
+class CSVEncoder:
+    media_type = "text/csv; charset=utf-8"
+
+    def __init__(self, columns):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self._writer.writerow([column.name for column in columns])
+
+    def encode(self, rows):
+        self._writer.writerows(rows)
+        return self._drain()
+
+    def finish(self):
+        return self._drain()
+
+    def _drain(self):
+        data = self._buffer.getvalue().encode()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+class NDJSONEncoder:
+    media_type = "application/x-ndjson"
+
+    def __init__(self, columns):
+        self._names = [column.name for column in columns]
+
+    def encode(self, rows):
+        return b"".join(dumps(dict(zip(self._names, row))) + b"\n" for row in rows)
+
+    def finish(self):
+        return b""
+
+
+class _ChunkSink(io.RawIOBase):
+    # file object for ParquetWriter that hands back what was written since the last drain
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ParquetEncoder:
+    media_type = "application/vnd.apache.parquet"
+
+    def __init__(self, columns):
+        if pyarrow is None:
+            raise ExportFormatUnavailable("format=parquet needs the 'pyarrow' package installed.")
+        types = {int: pyarrow.int64(), str: pyarrow.string(), date: pyarrow.date32()}
+        self._schema = pyarrow.schema(
+            [(column.name, types[column.type.python_type], column.nullable) for column in columns]
+        )
+        self._sink = _ChunkSink()
+        self._writer = pyarrow.parquet.ParquetWriter(self._sink, self._schema, compression="snappy")
+
+    def encode(self, rows):
+        # one row group per partition
+        columns = list(zip(*rows))
+        self._writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(values, type=field.type) for values, field in zip(columns, self._schema)],
+            schema=self._schema,
+        ))
+        return self._sink.drain()
+
+    def finish(self):
+        # the footer with the schema and row group offsets
+        self._writer.close()
+        return self._sink.drain()
+
+
+EXPORT_FORMATS = {"csv": CSVEncoder, "ndjson": NDJSONEncoder, "parquet": ParquetEncoder}
+
+
+def make_encoder(export_format, columns):
+    """Encoder for one of EXPORT_FORMATS; raises ExportFormatUnavailable if its package is missing."""
+    return EXPORT_FORMATS[export_format](columns)
+
+
+def iter_export(bind, statements, encoder, gzip=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """Encoded bytes for the rows of each statement in turn, gzipped if asked."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, GZIP_WBITS) if gzip else None
+
+    def output(data):
+        return compressor.compress(data) if compressor is not None else data
+
+    # one connection and read transaction for the whole export, so it is a
+    # consistent snapshot; closed early if the client goes away
+    with bind.connect() as conn:
+        for statement in statements:
+            result = conn.execution_options(yield_per=chunk_size).execute(statement)
+            for rows in result.partitions():
+                data = output(encoder.encode(rows))
+                if data:
+                    yield data
+    data = output(encoder.finish())
+    if compressor is not None:
+        data += compressor.flush()
+    if data:
+        yield data
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import delete, insert, select
+
+# Idempotency-Key support for POST /bookings/. The stored response is written
+# in the same transaction as the booking, so a key is remembered exactly when
+# its booking exists. A retry with the same key replays the stored response
+# without touching the bookings table. A concurrent duplicate waits for the
+# first request in the same process, or in another worker loses on the
+# primary key, and replays the winner's response either way.
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+# expired keys are deleted at most this often, piggybacking on a save
+PURGE_INTERVAL_SECONDS = 60.0
+
+
+class IdempotencyKeyReused(Exception):
+    pass
+
+
+class IdempotencyStore:
+    def __init__(self, table, ttl=None):
+        """table is an idempotency_keys_table(), defined with the app's models."""
+        if ttl is None:
+            ttl = float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        self.ttl = ttl
+        self.table = table
+        self._next_purge = 0.0
+        # key -> [lock, waiters] for requests currently using the key
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+    @contextmanager
+    def in_flight(self, key):
+        """Run requests sharing a key one at a time within this process."""
+        with self._in_flight_lock:
+            entry = self._in_flight.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._in_flight_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._in_flight[key]
+
+    @staticmethod
+    def fingerprint(route, payload):
+        """Hash of the route and request body, so a key can't be reused for a different request."""
+        encoded = json.dumps(payload, sort_keys=True, default=str, separators=(",", ":"))
+        return hashlib.sha256(f"{route}\n{encoded}".encode()).hexdigest()
+
+    def lookup(self, db, key, fingerprint):
+        """Stored (status_code, body) for key, or None; raises IdempotencyKeyReused on a mismatch."""
+        table = self.table
+        row = db.execute(
+            select(table.c.fingerprint, table.c.status_code, table.c.body)
+            .where(table.c.key == key, table.c.expires_at > time.time())
+        ).first()
+        if row is None:
+            return None
+        if row.fingerprint != fingerprint:
+            raise IdempotencyKeyReused("Idempotency-Key was already used for a different request.")
+        return row.status_code, row.body
+
+    def save(self, db, key, fingerprint, status_code, body):
+        """Add the response to the caller's transaction; committing is up to the caller."""
+        now = time.time()
+        if now >= self._next_purge:
+            self._next_purge = now + PURGE_INTERVAL_SECONDS
+            db.execute(delete(self.table).where(self.table.c.expires_at <= now))
+        # an expired row for this key may still be there between purges
+        db.execute(delete(self.table).where(self.table.c.key == key, self.table.c.expires_at <= now))
+        db.execute(insert(self.table).values(
+            key=key, fingerprint=fingerprint, status_code=status_code, body=body, expires_at=now + self.ttl,
+        ))
@@ -1,27 +1,158 @@
-from sqlalchemy import Column,Integer,String,create_engine,Date
-from fastapi import FastAPI,status,HTTPException,Depends
-from pydantic import BaseModel
-from sqlalchemy.orm import declarative_base,sessionmaker,Session
-from datetime import date
-from typing import Optional
-
-#create app
-app = FastAPI()
-
-engine = create_engine("sqlite:///./service_center.db",echo=True)
-Base = declarative_base()
-SessionLocal = sessionmaker(autocommit=False,bind=engine)
-
-#create db
-class ServiceBooking(Base):
-    __tablename__ = "service_booking"
-    id = Column(Integer,primary_key=True,index=True)
-    customer_name = Column(String,nullable=False)
-    vehicle_name = Column(String,nullable=False)
-    service_type = Column(String,nullable=False)
-    booking_date = Column(Date, nullable=False)
-
-Base.metadata.create_all(bind=engine)
+from sqlalchemy import insert,update,delete,select,union_all,func,text
+from fastapi import FastAPI,APIRouter,status,HTTPException,Depends,Query,Response,Request,Header,WebSocket,WebSocketDisconnect
+from fastapi.responses import StreamingResponse,PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel,ValidationError
+from sqlalchemy.orm import sessionmaker,Session
+from sqlalchemy.exc import IntegrityError
+from contextlib import asynccontextmanager
+import asyncio
+from datetime import date,timedelta
+from typing import List,Optional
+import json
+import logging
+import os
+
+from archive import archive_bookings,archive_cutoff
+from availability import BayCapacity,SlotUnavailable
+from cache import make_cache
+from database import get_settings,make_engine,sync_schema,drain_sessions,rebuild_table,sqlite_table_sql
+from directory import Directory,backfill,normalize_name,normalize_plate
+from events import EventBus
+from export import EXPORT_FORMATS,ExportFormatUnavailable,iter_export,make_encoder
+from idempotency import IdempotencyStore,IdempotencyKeyReused
+from metrics import REGISTRY,PROMETHEUS_CONTENT_TYPE,MetricsMiddleware,track_session
+from models import Base,BookingDailyRollup,Customer,IdempotencyKeys,ServiceBooking,ServiceBookingArchive,Vehicle
+from query_log import query_stats
+from responses import FastJSONResponse,dumps,loads
+from rollup import apply_deltas,bookings_report,is_empty,rebuild_rollup,slot_deltas
+from writebatch import GroupCommitWriter,make_writer_engine
+
+logger = logging.getLogger("service_center")
+
+# ARCHIVE_INTERVAL_SECONDS > 0 runs the archival job in the background
+ARCHIVE_INTERVAL_SECONDS = float(os.environ.get("ARCHIVE_INTERVAL_SECONDS", "0"))
+
+async def archive_periodically(interval):
+    while True:
+        try:
+            moved = await run_in_threadpool(archive_past_bookings)
+            if moved:
+                logger.info("archived %d bookings", moved)
+        except Exception:
+            logger.exception("booking archival failed")
+        await asyncio.sleep(interval)
+
+@asynccontextmanager
+async def lifespan(app):
+    # the engine and schema checks are set up here rather than at import time
+    settings = app.state.settings or get_settings()
+    init_db(settings)
+    if settings.auto_migrate:
+        await run_in_threadpool(migrate)
+    booking_events.bind(asyncio.get_running_loop())
+    await run_in_threadpool(vehicle_directory.load)
+    await run_in_threadpool(customer_directory.load)
+    global group_writer
+    # an in-memory database can't be shared with the writer's own connection
+    if settings.group_commit and not settings.is_memory:
+        group_writer = GroupCommitWriter(
+            make_writer_engine(settings), settings.group_commit_max_batch, settings.group_commit_delay_ms / 1000,
+        )
+        vehicle_directory.submit = customer_directory.submit = group_writer.submit
+    archiver = None
+    if ARCHIVE_INTERVAL_SECONDS > 0:
+        archiver = asyncio.create_task(archive_periodically(ARCHIVE_INTERVAL_SECONDS))
+    yield
+    if archiver is not None:
+        archiver.cancel()
+    # let in-flight requests finish with their sessions before closing the pool
+    still_open = await drain_sessions(engine)
+    if still_open:
+        logger.warning("shutting down with %d database sessions still open", still_open)
+    if group_writer is not None:
+        vehicle_directory.submit = customer_directory.submit = None
+        await run_in_threadpool(group_writer.close)
+        group_writer = None
+
+# bound by init_db(), normally from the lifespan
+engine = None
+engine_settings = None
+SessionLocal = sessionmaker(autocommit=False)
+# set by the lifespan when GROUP_COMMIT is on, see run_write()
+group_writer = None
+
+def init_db(settings=None):
+    """Bind SessionLocal to an engine for settings; without settings, reuse the current one.
+
+    An app created with different settings than the last one gets a new
+    engine, so create_app(settings) never runs against another app's database.
+    """
+    global engine, engine_settings
+    if settings is None:
+        if engine is not None:
+            return engine
+        settings = get_settings()
+    if engine is None or settings != engine_settings:
+        if engine is not None:
+            engine.dispose()
+            # cached payloads came from the other database
+            booking_cache.clear()
+        engine = make_engine(settings)
+        engine_settings = settings
+        SessionLocal.configure(bind=engine)
+    return engine
+
+def migrate():
+    sync_schema(Base.metadata, init_db())
+    # tables created before AUTOINCREMENT hand out the id of a deleted or archived row again
+    if engine.dialect.name == "sqlite" and "AUTOINCREMENT" not in sqlite_table_sql(engine, ServiceBooking.__tablename__).upper():
+        rebuild_table(engine, ServiceBooking.__table__)
+        reserve_archived_ids()
+    # bookings written before vehicle/customer entities existed
+    for table in (ServiceBooking.__table__, ServiceBookingArchive.__table__):
+        backfill(SessionLocal, table, vehicle_directory, customer_directory)
+    # first run with the rollup table: count the existing bookings into it
+    rollup = BookingDailyRollup.__table__
+    if is_empty(SessionLocal, rollup):
+        rebuild_rollup(SessionLocal, rollup, (ServiceBooking.__table__, ServiceBookingArchive.__table__))
+
+def reserve_archived_ids():
+    # the rebuilt table counts on from its own max(id); archived ids may be higher
+    table=ServiceBooking.__tablename__
+    with engine.begin() as conn:
+        top=conn.execute(select(func.max(ServiceBookingArchive.id))).scalar()
+        if top is None:
+            return
+        params={"name":table,"top":top}
+        if conn.execute(text("UPDATE sqlite_sequence SET seq = max(seq, :top) WHERE name = :name"),params).rowcount==0:
+            conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :top)"),params)
+
+# normalized plate -> vehicle id and customer name -> customer id, loaded at startup
+vehicle_directory = Directory(Vehicle.__table__, "plate", normalize_plate, SessionLocal)
+customer_directory = Directory(Customer.__table__, "name", normalize_name, SessionLocal)
+
+# routes are collected here and mounted by create_app()
+router = APIRouter(default_response_class=FastJSONResponse)
+
+# responses of POST /bookings/ by Idempotency-Key
+idempotency_store = IdempotencyStore(IdempotencyKeys)
+
+# reads select these columns as plain row tuples, skipping ORM identity-map objects
+BOOKING_FIELDS = ("id", "customer_name", "vehicle_name", "service_type", "booking_date", "version")
+
+def public_columns(table):
+    return tuple(table.c[name] for name in BOOKING_FIELDS)
+
+BOOKING_COLUMNS = public_columns(ServiceBooking.__table__)
+ARCHIVE_COLUMNS = public_columns(ServiceBookingArchive.__table__)
+
+# serialized GET /bookings/{booking_id} payloads, kept current by the write endpoints
+booking_cache = make_cache()
+# booked bays per (booking_date, service_type), rebuilt from the table at startup
+bay_capacity = BayCapacity.from_env()
+# change feed for GET /bookings/stream and the /bookings/ws websocket
+booking_events = EventBus(int(os.environ.get("BOOKING_EVENTS_CAPACITY", "4096")))
 
 #pydantic model
 class ServiceBookingCreate(BaseModel):
@@ -42,71 +173,796 @@ class serviceBookingUpdate(BaseModel):
 #     service_type :str
 #     booking_date :date
 
-class Config:
-    orm_mode = True 
+class BookingBatch(BaseModel):
+    ids : List[int]
+
+class BookingOut(BaseModel):
+    id : int
+    customer_name : str
+    vehicle_name : str
+    service_type : str
+    booking_date : date
+    version : int
+
+
+# rows fetched per round trip when streaming
+STREAM_CHUNK_SIZE = 1000
+# rows per executemany batch for bulk ingestion
+BULK_INSERT_BATCH_SIZE = 5000
+
+PAST_DATE_ERROR = "Booking date cannot be in the past."
+
+def validate_booking_date(booking_date):
+    if booking_date < date.today():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=PAST_DATE_ERROR
+        )
+
+def booking_to_dict(booking):
+    return {
+        "id": booking.id,
+        "customer_name": booking.customer_name,
+        "vehicle_name": booking.vehicle_name,
+        "service_type": booking.service_type,
+        "booking_date": booking.booking_date,
+        "version": booking.version,
+    }
+
+def booking_json(booking):
+    return dumps(booking_to_dict(booking))
+
+def select_bookings():
+    return select(*BOOKING_COLUMNS)
+
+def fetch_bookings(db, statement):
+    result = db.execute(statement)
+    keys = [str(key) for key in result.keys()]
+    return [dict(zip(keys, row)) for row in result]
+
+def json_page(bookings, limit):
+    # cursor for the next page; absent on the last page
+    headers = {"X-Next-After-Id": str(bookings[-1]["id"])} if len(bookings) == limit else None
+    return FastJSONResponse(bookings, headers=headers)
+
+def fetch_booking_page(db, after_id=None, limit=100):
+    statement = select_bookings()
+    if after_id is not None:
+        statement = statement.where(ServiceBooking.id > after_id)
+    return fetch_bookings(db, statement.order_by(ServiceBooking.id).limit(limit))
+
+# cached in place of a deleted booking until the TTL runs out, so a read
+# that fetched the row just before the delete can't put it back
+DELETED_BOOKING = b""
+
+def cache_booking(booking):
+    # writes overwrite whatever is cached, after their commit
+    payload = booking_json(booking)
+    booking_cache.set(booking.id, payload)
+    return payload
+
+def fill_booking(booking):
+    # reads only fill an empty key: the row they read may already be older
+    # than the payload a concurrent write has cached
+    payload = booking_json(booking)
+    booking_cache.add(booking.id, payload)
+    return payload
+
+def day_generation_key(booking_date):
+    return f"daygen:{booking_date.isoformat()}"
+
+def day_cache_key(booking_date, generation):
+    return f"day:{booking_date.isoformat()}:{generation.decode()}"
 
+def new_day_generation():
+    return os.urandom(8).hex().encode()
+
+def day_generation(booking_date):
+    # token naming the current bucket of a day; a missing one starts a new bucket
+    key = day_generation_key(booking_date)
+    generation = booking_cache.get(key)
+    if generation is None:
+        generation = new_day_generation()
+        if not booking_cache.add(key, generation):
+            generation = booking_cache.get(key) or generation
+    return generation
+
+def invalidate_days(*booking_dates):
+    # a write to a booking changes the cached list of its day, and only that day.
+    # Writers move the day to a new generation instead of deleting its bucket, so a
+    # fill that read the rows before the write lands under a key nobody reads
+    for booking_date in set(booking_dates):
+        booking_cache.set(day_generation_key(booking_date), new_day_generation())
+
+def day_bookings(db, booking_date):
+    # one cached bucket per day; capacity keeps each bucket small
+    key = day_cache_key(booking_date, day_generation(booking_date))
+    payload = booking_cache.get(key)
+    if payload is not None:
+        return loads(payload)
+    bookings = fetch_bookings(
+        db, select_bookings().where(ServiceBooking.booking_date == booking_date).order_by(ServiceBooking.id)
+    )
+    booking_cache.add(key, dumps(bookings))
+    return bookings
+
+def publish_booking(kind, booking):
+    booking_events.publish(kind, booking_to_dict(booking))
+
+def iter_bookings_ndjson(after_id=None, chunk_size=STREAM_CHUNK_SIZE):
+    # keyset walk over the primary key, one short-lived session per chunk so
+    # memory stays flat and no read transaction is held for the whole stream
+    last_id = after_id or 0
+    while True:
+        db = SessionLocal()
+        try:
+            chunk = fetch_booking_page(db, last_id, chunk_size)
+            lines = b"".join(dumps(booking) + b"\n" for booking in chunk)
+        finally:
+            db.close()
+        if not chunk:
+            return
+        last_id = chunk[-1]["id"]
+        yield lines
+        if len(chunk) < chunk_size:
+            return
+
+# widest window GET /availability will answer
+MAX_AVAILABILITY_DAYS = 366
+
+def archive_past_bookings():
+    return archive_bookings(SessionLocal, ServiceBooking.__table__, ServiceBookingArchive.__table__, archive_cutoff())
+
+def update_rollup(db, added=(), removed=()):
+    # same transaction as the booking write, so reports never drift from it;
+    # also the capacity check, which holds across workers
+    try:
+        apply_deltas(db, BookingDailyRollup.__table__, slot_deltas(added, removed), bay_capacity.capacity)
+    except SlotUnavailable as e:
+        raise slot_unavailable(e)
+
+def run_write(db, write):
+    """Run write(session) and commit it; returns what write returned.
+
+    With GROUP_COMMIT on, the write is committed by the group-commit writer
+    together with other requests' writes, so write gets the writer's session,
+    not db, and must not commit or keep ORM objects from it.
+    """
+    if group_writer is not None:
+        return group_writer.submit(write)
+    try:
+        result = write(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return result
+
+def update_booking_row(db, booking_id, values, expected_version=None):
+    """UPDATE ... RETURNING the booking's columns, or None if no row matched."""
+    statement = (
+        update(ServiceBooking)
+        .where(ServiceBooking.id == booking_id)
+        .values(**values, version=ServiceBooking.version + 1)
+        .returning(*BOOKING_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    if expected_version is not None:
+        statement = statement.where(ServiceBooking.version == expected_version)
+    return db.execute(statement).first()
+
+def booking_not_found():
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Booking not found."
+    )
+
+def booking_write_missed(db, booking_id, conflict_status=status.HTTP_409_CONFLICT):
+    # a version-guarded UPDATE/DELETE matched no row: the booking is gone, or
+    # another request changed it since its version was read
+    if db.execute(select(ServiceBooking.id).where(ServiceBooking.id == booking_id)).first():
+        return HTTPException(
+            status_code=conflict_status,
+            detail="Booking was modified by another request."
+        )
+    return booking_not_found()
+
+def slot_unavailable(e):
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=str(e)
+    )
+
+def replay_idempotent(db, idempotency_key, fingerprint):
+    try:
+        stored = idempotency_store.lookup(db, idempotency_key, fingerprint)
+    except IdempotencyKeyReused as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    if stored is None:
+        return None
+    status_code, body = stored
+    return Response(content=body, status_code=status_code, media_type="application/json", headers={"Idempotent-Replayed": "true"})
 
 #dependency 
 def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    yield from track_session(SessionLocal)
+
+@router.post("/bookings/", response_model=BookingOut)
+def create_booking(
+    booking: ServiceBookingCreate,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    if idempotency_key is None:
+        return insert_booking(db, booking)
+    # requests sharing a key run one at a time here, so an in-flight duplicate
+    # waits and replays instead of holding a second slot
+    with idempotency_store.in_flight(idempotency_key):
+        # a retry of a request that already succeeded gets the original response
+        fingerprint = idempotency_store.fingerprint("POST /bookings/", booking.dict())
+        replay = replay_idempotent(db, idempotency_key, fingerprint)
+        if replay is not None:
+            return replay
+        return insert_booking(db, booking, idempotency_key, fingerprint)
 
-@app.post("/bookings/")
-def create_booking(booking: ServiceBookingCreate, db: Session = Depends(get_db)):
+def insert_booking(db, booking, idempotency_key=None, fingerprint=None):
     # Validate booking date
-    if booking.booking_date < date.today():
+    validate_booking_date(booking.booking_date)
+    vehicle_id = vehicle_directory.resolve(booking.vehicle_name)
+    customer_id = customer_directory.resolve(booking.customer_name)
+    slot = (booking.booking_date, booking.service_type)
+    values = dict(booking.dict(), vehicle_id=vehicle_id, customer_id=customer_id)
+
+    def write(session):
+        new_booking = session.execute(insert(ServiceBooking).values(**values).returning(*BOOKING_COLUMNS)).one()
+        update_rollup(session, added=[slot])
+        if idempotency_key is not None:
+            idempotency_store.save(session, idempotency_key, fingerprint, status.HTTP_200_OK, booking_json(new_booking))
+        return new_booking
+
+    try:
+        new_booking = run_write(db, write)
+    except IntegrityError:
+        # a request with the same key in another worker committed first
+        replay = replay_idempotent(db, idempotency_key, fingerprint) if idempotency_key is not None else None
+        if replay is None:
+            raise
+        return replay
+    invalidate_days(new_booking.booking_date)
+    publish_booking("created", new_booking)
+    return Response(content=cache_booking(new_booking), media_type="application/json")
+
+
+def parse_bulk_body(body, content_type):
+    # accepts a JSON array or one JSON object per line (NDJSON)
+    try:
+        if "ndjson" in content_type:
+            return [json.loads(line) for line in body.splitlines() if line.strip()]
+        items = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid request body: {e}"
+        )
+    if not isinstance(items, list):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Booking date cannot be in the past."
+            detail="Expected a JSON array of bookings."
         )
-    new_booking = ServiceBooking(**booking.dict())
-    db.add(new_booking)
-    db.commit()
-    db.refresh(new_booking)
-    return new_booking
+    return items
 
+@router.post("/bookings/bulk")
+async def create_bookings_bulk(request: Request, db: Session = Depends(get_db)):
+    body = await request.body()
+    # parsing and validating a large body is CPU work, keep it off the event loop
+    rows = await run_in_threadpool(validate_bulk_body, body, request.headers.get("content-type", ""))
+    return await run_in_threadpool(insert_bookings_bulk, db, rows)
 
-@app.get("/bookings/get-all/")
-def get_all_bookings(db: Session = Depends(get_db)):
-    bookings = db.query(ServiceBooking).all()
-    return bookings
+def validate_bulk_body(body, content_type):
+    items = parse_bulk_body(body, content_type)
+    # validate everything first so nothing is written unless the whole batch is good
+    today = date.today()
+    rows = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            booking = ServiceBookingCreate.parse_obj(item)
+        except ValidationError as e:
+            errors.append({"index": index, "errors": [{"loc": err["loc"], "msg": err["msg"]} for err in e.errors()]})
+            continue
+        if booking.booking_date < today:
+            errors.append({"index": index, "errors": [{"msg": PAST_DATE_ERROR}]})
+            continue
+        rows.append(booking.dict())
+    if errors:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=errors
+        )
+    return rows
 
-@app.get("/bookings/{booking_id}")
-def get_booking_by_id(booking_id: int, db: Session = Depends(get_db)):
-    booking = db.query(ServiceBooking).filter(ServiceBooking.id == booking_id).first()
-    if not booking:
+def insert_bookings_bulk(db, rows):
+    # executemany batches inside a single transaction; RETURNING keeps ids in input order
+    statement = insert(ServiceBooking).returning(ServiceBooking.id, sort_by_parameter_order=True)
+    vehicle_ids = vehicle_directory.resolve_many([row["vehicle_name"] for row in rows])
+    customer_ids = customer_directory.resolve_many([row["customer_name"] for row in rows])
+    params = [
+        {**row, "vehicle_id": vehicle_id, "customer_id": customer_id}
+        for row, vehicle_id, customer_id in zip(rows, vehicle_ids, customer_ids)
+    ]
+
+    def write(session):
+        results = []
+        for start in range(0, len(params), BULK_INSERT_BATCH_SIZE):
+            batch = params[start:start + BULK_INSERT_BATCH_SIZE]
+            ids = session.execute(statement, batch).scalars().all()
+            results.extend({"index": start + i, "id": booking_id} for i, booking_id in enumerate(ids))
+        update_rollup(session, added=[(row["booking_date"], row["service_type"]) for row in rows])
+        return results
+
+    # one write for the whole list, so it still commits or fails as a unit
+    results = run_write(db, write)
+    invalidate_days(*(row["booking_date"] for row in rows))
+    booking_events.publish_many(
+        "created", [{"id": result["id"], **row, "version": 1} for result, row in zip(results, rows)]
+    )
+    return {"created": len(results), "results": results}
+
+@router.get("/bookings/get-all/", response_model=List[BookingOut])
+def get_all_bookings(
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = Query(None, ge=0),
+    stream: bool = False,
+    db: Session = Depends(get_db),
+):
+    # stream=true returns every booking after after_id as NDJSON
+    if stream:
+        return StreamingResponse(iter_bookings_ndjson(after_id), media_type="application/x-ndjson")
+    return json_page(fetch_booking_page(db, after_id, limit), limit)
+
+@router.get("/bookings/export")
+def export_bookings(
+    export_format: str = Query("csv", alias="format", description="csv, ndjson or parquet (needs pyarrow)."),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    gzip: bool = False,
+):
+    # every booking in the range, archived ones first, streamed in constant memory
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"format must be one of {', '.join(EXPORT_FORMATS)}."
+        )
+    try:
+        encoder = make_encoder(export_format, BOOKING_COLUMNS)
+    except ExportFormatUnavailable as e:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=str(e)
+        )
+
+    def in_range(table):
+        # ordered by the booking_date index, so there is no sort to wait for
+        statement = select(*public_columns(table))
+        if date_from is not None:
+            statement = statement.where(table.c.booking_date >= date_from)
+        if date_to is not None:
+            statement = statement.where(table.c.booking_date <= date_to)
+        return statement.order_by(table.c.booking_date, table.c.id)
+
+    statements = [in_range(ServiceBooking.__table__)]
+    if date_from is None or date_from < archive_cutoff():
+        statements.insert(0, in_range(ServiceBookingArchive.__table__))
+    filename = f"bookings.{export_format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        iter_export(engine, statements, encoder, gzip),
+        media_type="application/gzip" if gzip else encoder.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get("/bookings/search", response_model=List[BookingOut])
+def search_bookings(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    vehicle_name: Optional[str] = None,
+    customer_name: Optional[str] = Query(None, description="Matches names starting with this prefix."),
+    service_type: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(get_db),
+):
+    def filtered(table):
+        # equality filters first so SQLite can pick the (column, booking_date) indexes
+        statement = select(*public_columns(table))
+        if vehicle_name is not None:
+            statement = statement.where(table.c.vehicle_name == vehicle_name)
+        if service_type is not None:
+            statement = statement.where(table.c.service_type == service_type)
+        if date_from is not None:
+            statement = statement.where(table.c.booking_date >= date_from)
+        if date_to is not None:
+            statement = statement.where(table.c.booking_date <= date_to)
+        if customer_name:
+            statement = statement.where(table.c.customer_name.startswith(customer_name, autoescape=True))
+        if after_id is not None:
+            statement = statement.where(table.c.id > after_id)
+        return statement
+
+    statement = filtered(ServiceBooking.__table__)
+    # only ranges reaching back past the retention window touch the archive
+    if date_from is not None and date_from < archive_cutoff():
+        combined = union_all(statement, filtered(ServiceBookingArchive.__table__)).subquery()
+        statement = select(*combined.c).order_by(combined.c.id)
+    else:
+        statement = statement.order_by(ServiceBooking.id)
+    bookings = fetch_bookings(db, statement.limit(limit))
+    return json_page(bookings, limit)
+
+@router.get("/vehicles/{vehicle_number}/bookings", response_model=List[BookingOut])
+def get_vehicle_bookings(
+    vehicle_number: str,
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(get_db),
+):
+    # the plate resolves in memory, then both tables are read through their vehicle_id index
+    vehicle_id = vehicle_directory.lookup(vehicle_number)
+    if vehicle_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Booking not found."
+            detail="Vehicle not found."
+        )
+
+    def history(table):
+        statement = select(*public_columns(table)).where(table.c.vehicle_id == vehicle_id)
+        if after_id is not None:
+            statement = statement.where(table.c.id > after_id)
+        return statement
+
+    combined = union_all(history(ServiceBooking.__table__), history(ServiceBookingArchive.__table__)).subquery()
+    bookings = fetch_bookings(db, select(*combined.c).order_by(combined.c.id).limit(limit))
+    return json_page(bookings, limit)
+
+# most ids a GET (kept short for URL limits) and a POST batch may ask for, and ids per IN (...) query
+MAX_BATCH_IDS = 1000
+MAX_POST_BATCH_IDS = 50000
+BATCH_CHUNK_SIZE = 500
+
+def batch_payload(db, ids, max_ids=MAX_BATCH_IDS):
+    # cached payloads first, then one IN query per chunk for the rest, live table before archive
+    if len(ids) > max_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {max_ids} ids per request."
+        )
+    ids = list(dict.fromkeys(ids))
+    payloads = {}
+    deleted = set()
+    for start in range(0, len(ids), BATCH_CHUNK_SIZE):
+        chunk = ids[start:start + BATCH_CHUNK_SIZE]
+        # one cache round trip per chunk, not per id
+        for booking_id, payload in zip(chunk, booking_cache.get_many(chunk)):
+            if payload == DELETED_BOOKING:
+                deleted.add(booking_id)
+            elif payload is not None:
+                payloads[booking_id] = payload
+    for columns, id_column in ((BOOKING_COLUMNS, ServiceBooking.id), (ARCHIVE_COLUMNS, ServiceBookingArchive.id)):
+        pending = [booking_id for booking_id in ids if booking_id not in payloads and booking_id not in deleted]
+        for start in range(0, len(pending), BATCH_CHUNK_SIZE):
+            chunk = pending[start:start + BATCH_CHUNK_SIZE]
+            for booking in db.execute(select(*columns).where(id_column.in_(chunk))):
+                payloads[booking.id] = fill_booking(booking)
+    # stitched from the cached JSON bytes, in request order
+    missing = [booking_id for booking_id in ids if booking_id not in payloads]
+    found = b",".join(payloads[booking_id] for booking_id in ids if booking_id in payloads)
+    return b'{"bookings":[' + found + b'],"missing":' + dumps(missing) + b"}"
+
+@router.get("/bookings/batch")
+def get_bookings_batch(
+    ids: str = Query(..., description="Comma separated booking ids, at most 1000; POST /bookings/batch takes up to 50000."),
+    db: Session = Depends(get_db),
+):
+    try:
+        booking_ids = [int(booking_id) for booking_id in ids.split(",") if booking_id.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids must be comma separated integers."
         )
-    return booking
+    return Response(content=batch_payload(db, booking_ids), media_type="application/json")
+
+@router.post("/bookings/batch")
+def post_bookings_batch(batch: BookingBatch, db: Session = Depends(get_db)):
+    return Response(content=batch_payload(db, batch.ids, MAX_POST_BATCH_IDS), media_type="application/json")
+
+# widest window GET /bookings/upcoming will answer
+MAX_UPCOMING_DAYS = 31
+
+@router.get("/bookings/upcoming", response_model=List[BookingOut])
+def get_upcoming_bookings(
+    days: int = Query(7, ge=1, le=MAX_UPCOMING_DAYS),
+    limit: int = Query(100, ge=1, le=1000),
+    after_date: Optional[date] = None,
+    after_id: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(get_db),
+):
+    # bookings from today through the next days-1 days, ordered by (booking_date, id);
+    # the next page resumes from X-Next-After-Date and X-Next-After-Id
+    today = date.today()
+    end = today + timedelta(days=days - 1)
+    day = max(today, after_date) if after_date is not None else today
+    bookings = []
+    while day <= end and len(bookings) < limit:
+        bucket = day_bookings(db, day)
+        if day == after_date and after_id is not None:
+            bucket = [booking for booking in bucket if booking["id"] > after_id]
+        bookings.extend(bucket[:limit - len(bookings)])
+        day += timedelta(days=1)
+    headers = None
+    if len(bookings) == limit:
+        headers = {"X-Next-After-Date": str(bookings[-1]["booking_date"]), "X-Next-After-Id": str(bookings[-1]["id"])}
+    return FastJSONResponse(bookings, headers=headers)
+
+def parse_last_event_id(last_event_id, after_seq):
+    # EventSource resends the last id it saw as Last-Event-ID on reconnect
+    if after_seq is not None:
+        return after_seq
+    if last_event_id is None:
+        return None
+    try:
+        return int(last_event_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Last-Event-ID must be an event sequence number."
+        )
+
+async def iter_booking_sse(last_seq):
+    # clients that fall off the ring get a "reset" event and should refetch
+    async for event in booking_events.subscribe(last_seq):
+        if event is None:
+            yield b": keepalive\n\n"
+            continue
+        yield b"id: %d\nevent: %s\ndata: %s\n\n" % (event["seq"], event["type"].encode(), dumps(event["booking"]))
 
-@app.put("/bookings/{booking_id}")
+@router.get("/bookings/stream")
+async def stream_booking_events(
+    after_seq: Optional[int] = Query(None, ge=0),
+    last_event_id: Optional[str] = Header(None),
+):
+    # without a resume point only events from now on are sent
+    last_seq = parse_last_event_id(last_event_id, after_seq)
+    return StreamingResponse(
+        iter_booking_sse(last_seq),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/bookings/ws")
+async def booking_events_websocket(websocket: WebSocket, after_seq: Optional[int] = Query(None, ge=0)):
+    await websocket.accept()
+    try:
+        # each send waits for the client, so a slow reader just lags behind in the ring
+        async for event in booking_events.subscribe(after_seq):
+            if event is None:
+                event = {"type": "keepalive", "seq": booking_events.last_seq}
+            await websocket.send_text(dumps(event).decode())
+    except WebSocketDisconnect:
+        pass
+
+@router.get("/bookings/{booking_id}", response_model=BookingOut)
+def get_booking_by_id(booking_id: int, db: Session = Depends(get_db)):
+    payload = booking_cache.get(booking_id)
+    if payload == DELETED_BOOKING:
+        raise booking_not_found()
+    if payload is None:
+        booking = db.execute(select_bookings().where(ServiceBooking.id == booking_id)).first()
+        if not booking:
+            # archived bookings stay readable by id
+            booking = db.execute(select(*ARCHIVE_COLUMNS).where(ServiceBookingArchive.id == booking_id)).first()
+        if not booking:
+            raise booking_not_found()
+        payload = fill_booking(booking)
+    return Response(content=payload, media_type="application/json")
+
+@router.put("/bookings/{booking_id}", response_model=BookingOut)
 def update_booking(booking_id: int, updated_booking: serviceBookingUpdate, db: Session = Depends(get_db)):
-    booking = db.query(ServiceBooking).filter(ServiceBooking.id == booking_id).first()
+    booking = db.execute(select_bookings().where(ServiceBooking.id == booking_id)).first()
     if not booking:
+        raise booking_not_found()
+    values = updated_booking.dict(exclude_none=True)
+    if not values:
+        return Response(content=fill_booking(booking), media_type="application/json")
+    # Validate booking date
+    if "booking_date" in values:
+        validate_booking_date(values["booking_date"])
+    if "customer_name" in values:
+        values["customer_id"] = customer_directory.resolve(values["customer_name"])
+    if "vehicle_name" in values:
+        values["vehicle_id"] = vehicle_directory.resolve(values["vehicle_name"])
+    old_slot = (booking.booking_date, booking.service_type)
+    new_slot = (values.get("booking_date", old_slot[0]), values.get("service_type", old_slot[1]))
+
+    def write(session):
+        # only if nobody changed it since it was read, so old_slot is still right
+        updated = update_booking_row(session, booking_id, values, booking.version)
+        if updated is None:
+            raise booking_write_missed(session, booking_id)
+        update_rollup(session, added=[new_slot], removed=[old_slot])
+        return updated
+
+    booking = run_write(db, write)
+    invalidate_days(old_slot[0], booking.booking_date)
+    publish_booking("updated", booking)
+    return Response(content=cache_booking(booking), media_type="application/json")
+
+def parse_if_match(if_match):
+    # returns the expected version, or None when any version is acceptable
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Booking not found."
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="If-Match must be a booking version ETag."
         )
-    # Validate booking date
-    if updated_booking.booking_date is not None and updated_booking.booking_date < date.today():
+
+@router.patch("/bookings/{booking_id}", response_model=BookingOut)
+def patch_booking(
+    booking_id: int,
+    changes: serviceBookingUpdate,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    values = changes.dict(exclude_none=True)
+    if not values:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Booking date cannot be in the past."
-        )
-    if updated_booking.customer_name is not None:
-        booking.customer_name = updated_booking.customer_name
-    if updated_booking.vehicle_name is not None:
-        booking.vehicle_name = updated_booking.vehicle_name 
-    if updated_booking.service_type is not None:
-        booking.service_type = updated_booking.service_type
-    if updated_booking.booking_date is not None:
-        booking.booking_date = updated_booking.booking_date
-
-    db.commit()
-    db.refresh(booking)
-    return booking
\ No newline at end of file
+            detail="No fields to update."
+        )
+    if "booking_date" in values:
+        validate_booking_date(values["booking_date"])
+    expected_version = parse_if_match(if_match)
+    if "vehicle_name" in values:
+        values["vehicle_id"] = vehicle_directory.resolve(values["vehicle_name"])
+    if "customer_name" in values:
+        values["customer_id"] = customer_directory.resolve(values["customer_name"])
+
+    # moving a booking needs its current slot, which RETURNING can't give us;
+    # the UPDATE is then guarded by the version the slot was read at, so a
+    # concurrent move can't leave the rollup on the wrong slot
+    old_slot = new_slot = None
+    guard_version, conflict_status = expected_version, status.HTTP_412_PRECONDITION_FAILED
+    if "booking_date" in values or "service_type" in values:
+        current = (
+            db.query(ServiceBooking.booking_date, ServiceBooking.service_type, ServiceBooking.version)
+            .filter(ServiceBooking.id == booking_id)
+            .first()
+        )
+        if current is None:
+            raise booking_not_found()
+        if expected_version is not None and current.version != expected_version:
+            raise HTTPException(
+                status_code=status.HTTP_412_PRECONDITION_FAILED,
+                detail="Booking was modified by another request."
+            )
+        if expected_version is None:
+            guard_version, conflict_status = current.version, status.HTTP_409_CONFLICT
+        old_slot = (current.booking_date, current.service_type)
+        new_slot = (values.get("booking_date", old_slot[0]), values.get("service_type", old_slot[1]))
+
+    # one UPDATE ... RETURNING: no SELECT before it and no refresh after it
+    def write(session):
+        updated = update_booking_row(session, booking_id, values, guard_version)
+        if updated is None:
+            raise booking_write_missed(session, booking_id, conflict_status)
+        if old_slot is not None:
+            update_rollup(session, added=[new_slot], removed=[old_slot])
+        return updated
+
+    booking = run_write(db, write)
+    invalidate_days(booking.booking_date)
+    if old_slot is not None:
+        invalidate_days(old_slot[0])
+    publish_booking("updated", booking)
+    payload = cache_booking(booking)
+    return Response(content=payload, media_type="application/json", headers={"ETag": f'"{booking.version}"'})
+
+@router.delete("/bookings/{booking_id}")
+def delete_booking(booking_id: int, db: Session = Depends(get_db)):
+    current = (
+        db.query(ServiceBooking.booking_date, ServiceBooking.service_type, ServiceBooking.version)
+        .filter(ServiceBooking.id == booking_id)
+        .first()
+    )
+    if current is None:
+        raise booking_not_found()
+    slot = (current.booking_date, current.service_type)
+
+    def write(session):
+        # only the version the slot was read at, or the release lands on the wrong slot
+        deleted = session.execute(
+            delete(ServiceBooking)
+            .where(ServiceBooking.id == booking_id, ServiceBooking.version == current.version)
+            .execution_options(synchronize_session=False)
+        )
+        if not deleted.rowcount:
+            raise booking_write_missed(session, booking_id)
+        update_rollup(session, removed=[slot])
+
+    run_write(db, write)
+    booking_cache.set(booking_id, DELETED_BOOKING)
+    invalidate_days(slot[0])
+    booking_events.publish("deleted", {"id": booking_id})
+    return {"detail": "Booking deleted successfully."}
+
+@router.get("/availability")
+def get_availability(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    db: Session = Depends(get_db),
+):
+    # answered from the rollup, O(days x service types) regardless of table size
+    date_from = date_from or date.today()
+    date_to = date_to or date_from + timedelta(days=6)
+    if date_to < date_from or (date_to - date_from).days >= MAX_AVAILABILITY_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"'to' must be on or after 'from' and at most {MAX_AVAILABILITY_DAYS} days later."
+        )
+    rollup = BookingDailyRollup.__table__
+    counts = db.execute(
+        select(rollup.c.booking_date, rollup.c.service_type, rollup.c.bookings)
+        .where(rollup.c.booking_date >= date_from, rollup.c.booking_date <= date_to)
+    ).all()
+    return bay_capacity.availability(counts, date_from, date_to)
+
+# GET /reports/bookings group_by names -> rollup columns
+REPORT_GROUPS = {"date": "booking_date", "service_type": "service_type"}
+
+@router.get("/reports/bookings")
+def get_bookings_report(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    group_by: str = Query("date,service_type", description="date, service_type or both, comma separated."),
+    service_type: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    # read from the rollup table, O(days x service types) regardless of table size
+    names = list(dict.fromkeys(name.strip() for name in group_by.split(",") if name.strip()))
+    if not names or any(name not in REPORT_GROUPS for name in names):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="group_by must be date, service_type or date,service_type."
+        )
+    rows = bookings_report(db, BookingDailyRollup.__table__, date_from, date_to, [REPORT_GROUPS[name] for name in names], service_type)
+    return {"from": date_from, "to": date_to, "group_by": names, "total": sum(row["bookings"] for row in rows), "rows": rows}
+
+@router.get("/cache/stats")
+def get_cache_stats():
+    return booking_cache.stats()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@router.get("/stats/queries")
+def get_query_stats():
+    return query_stats()
+
+def create_app(settings=None):
+    app = FastAPI(lifespan=lifespan,default_response_class=FastJSONResponse)
+    # read by the lifespan; None means get_settings() at startup
+    app.state.settings = settings
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(router)
+    return app
+
+app = create_app()
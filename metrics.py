@@ -0,0 +1,222 @@
+import time
+from bisect import bisect_left
+
+# Prometheus-style metrics without a client library. Updates are plain
+# attribute/list increments with no locks: HTTP metrics are only touched from
+# the event loop thread, and for the few metrics updated from threadpool
+# workers a rare lost increment is an acceptable price for a lock-free path.
+
+# Latency buckets in seconds, preallocated once per histogram so observe() is
+# just a bisect and two additions.
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # one slot per bucket plus +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Family:
+    """A named metric with one child per combination of label values."""
+
+    def __init__(self, name, documentation, kind, factory, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self._factory = factory
+        if not self.labelnames:
+            self._default = self.children[()] = factory()
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children.setdefault(values, self._factory())
+        return child
+
+    # unlabelled families proxy straight to their single child
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+
+class Registry:
+    def __init__(self):
+        self.families = {}
+
+    def _family(self, name, documentation, kind, factory, labelnames):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = Family(name, documentation, kind, factory, labelnames)
+        return family
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._family(name, documentation, "counter", Counter, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._family(name, documentation, "gauge", Gauge, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._family(name, documentation, "histogram", lambda: Histogram(buckets), labelnames)
+
+    def render(self):
+        """Prometheus text exposition format, version 0.0.4."""
+        lines = []
+        for family in list(self.families.values()):
+            lines.append(f"# HELP {family.name} {family.documentation}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for values, child in list(family.children.items()):
+                labels = list(zip(family.labelnames, values))
+                if family.kind != "histogram":
+                    lines.append(f"{family.name}{_format_labels(labels)} {child.value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(child.buckets + (float("inf"),), child.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{family.name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}")
+                lines.append(f"{family.name}_sum{_format_labels(labels)} {child.sum}")
+                lines.append(f"{family.name}_count{_format_labels(labels)} {child.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+REGISTRY = Registry()
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by method, route template and status.", ("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests currently being served.")
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route template.", ("method", "route"),
+)
+DB_POOL_WAIT = REGISTRY.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection.",
+)
+DB_SESSION_LIFETIME = REGISTRY.histogram(
+    "db_session_lifetime_seconds", "Lifetime of request-scoped database sessions from get_db.",
+)
+DB_SESSIONS_OPEN = REGISTRY.gauge("db_sessions_open", "Request-scoped database sessions currently open.")
+DB_GROUP_COMMIT_BATCH = REGISTRY.histogram(
+    "db_group_commit_batch_size", "Writes committed together by the group-commit writer.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+
+
+def track_session(session_factory):
+    """Yield a session from session_factory, recording its lifetime; for get_db."""
+    start = time.perf_counter()
+    DB_SESSIONS_OPEN.inc()
+    db = session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
+        DB_SESSIONS_OPEN.dec()
+        DB_SESSION_LIFETIME.observe(time.perf_counter() - start)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts and latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            # the router stores the matched route in the scope, so raw ids never become labels
+            route = scope.get("route")
+            template = getattr(route, "path", "<unmatched>")
+            method = scope["method"]
+            HTTP_LATENCY.labels(method, template).observe(elapsed)
+            HTTP_REQUESTS.labels(method, template, str(status_code)).inc()
@@ -0,0 +1,111 @@
+from sqlalchemy import Column, Date, Float, ForeignKey, Index, Integer, LargeBinary, String, Table
+from sqlalchemy.orm import declarative_base
+
+# Table definitions shared by the app variants. Importing this module has no
+# side effects: engines and schema checks belong to each app's lifespan.
+
+# main.py and asyncmain.py
+Base = declarative_base()
+
+
+def idempotency_keys_table(metadata, name="idempotency_keys"):
+    """Stored POST /bookings/ responses by Idempotency-Key, see idempotency.py."""
+    return Table(
+        name,
+        metadata,
+        Column("key", String, primary_key=True),
+        Column("fingerprint", String, nullable=False),
+        Column("status_code", Integer, nullable=False),
+        Column("body", LargeBinary, nullable=False),
+        Column("expires_at", Float, nullable=False, index=True),
+    )
+
+
+IdempotencyKeys = idempotency_keys_table(Base.metadata)
+
+
+# one row per normalized plate / customer name, see directory.py
+class Vehicle(Base):
+    __tablename__ = "vehicle"
+    id = Column(Integer, primary_key=True)
+    plate = Column(String, nullable=False, unique=True)
+
+
+class Customer(Base):
+    __tablename__ = "customer"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, unique=True)
+
+
+class ServiceBooking(Base):
+    __tablename__ = "service_booking"
+    id = Column(Integer, primary_key=True, index=True)
+    customer_name = Column(String, nullable=False)
+    vehicle_name = Column(String, nullable=False)
+    service_type = Column(String, nullable=False)
+    booking_date = Column(Date, nullable=False)
+    # bumped on every write; PATCH checks it against If-Match
+    version = Column(Integer, nullable=False, server_default="1")
+    # filled from vehicle_name/customer_name on write; nullable so existing
+    # tables can be altered, migrate() backfills them
+    vehicle_id = Column(Integer, ForeignKey("vehicle.id"), nullable=True)
+    customer_id = Column(Integer, ForeignKey("customer.id"), nullable=True)
+
+    __mapper_args__ = {"version_id_col": version}
+
+    # date-range lookups, per-vehicle history and per-service schedules
+    __table_args__ = (
+        Index("ix_service_booking_booking_date", "booking_date"),
+        Index("ix_service_booking_vehicle_name_booking_date", "vehicle_name", "booking_date"),
+        Index("ix_service_booking_service_type_booking_date", "service_type", "booking_date"),
+        # SQLite keeps rowid in every index entry, so (vehicle_id) also serves ORDER BY id
+        Index("ix_service_booking_vehicle_id", "vehicle_id"),
+        Index("ix_service_booking_customer_id", "customer_id"),
+        # never hand out an id again once its row was deleted or archived
+        {"sqlite_autoincrement": True},
+    )
+
+
+# cold store for bookings older than the retention window, see archive.py
+class ServiceBookingArchive(Base):
+    __tablename__ = "service_booking_archive"
+    id = Column(Integer, primary_key=True)
+    customer_name = Column(String, nullable=False)
+    vehicle_name = Column(String, nullable=False)
+    service_type = Column(String, nullable=False)
+    booking_date = Column(Date, nullable=False, index=True)
+    version = Column(Integer, nullable=False, server_default="1")
+    # same columns in the same order as service_booking, for archive.py and union_all
+    vehicle_id = Column(Integer, nullable=True, index=True)
+    customer_id = Column(Integer, nullable=True, index=True)
+
+
+# bookings per day and service type, kept current by the write endpoints; see rollup.py
+class BookingDailyRollup(Base):
+    __tablename__ = "booking_daily_rollup"
+    booking_date = Column(Date, primary_key=True)
+    service_type = Column(String, primary_key=True)
+    bookings = Column(Integer, nullable=False, server_default="0")
+
+
+# vehicle.py keeps its own tables
+VehicleBase = declarative_base()
+VehicleIdempotencyKeys = idempotency_keys_table(VehicleBase.metadata)
+
+
+class VehicleServiceBooking(VehicleBase):
+    __tablename__ = "service_bookings"
+    id = Column(Integer, primary_key=True, index=True)
+    customer_name = Column(String, nullable=False)
+    # Not unique, a vehicle comes back for more services. vehicle.py's
+    # migrate() rebuilds tables created with the old UNIQUE constraint.
+    vehicle_number = Column(String, nullable=False)
+    # normalize_plate(vehicle_number) for the per-vehicle history; nullable so
+    # existing tables can be altered, migrate() backfills it
+    plate = Column(String, nullable=True, index=True)
+    service_type = Column(String, nullable=False)
+    booking_date = Column(Date, nullable=False)
+    # Bumped on every write; PATCH checks it against If-Match
+    version = Column(Integer, nullable=False, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
@@ -0,0 +1,84 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+
+from sqlalchemy import event
+
+from metrics import REGISTRY
+
+# Per-statement SQL timing, replacing echo=True. Every statement is timed into
+# a histogram; only slow statements (SQL_SLOW_QUERY_MS) and a random sample
+# (SQL_LOG_SAMPLE_RATE) are logged, and logging goes through a QueueHandler so
+# the request thread never blocks on stdout/stderr.
+MAX_TRACKED_STATEMENTS = 256
+OTHER_STATEMENTS = "<other>"
+
+logger = logging.getLogger("service_center.sql")
+
+QUERY_SECONDS = REGISTRY.histogram(
+    "sql_query_duration_seconds", "SQL statement execution time by normalized statement.", ("statement",),
+)
+
+_listener = None
+
+
+def _start_queue_logging():
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    _listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler(sys.stderr))
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def _normalize(statement):
+    return " ".join(statement.split())[:200]
+
+
+def _histogram_for(statement):
+    key = _normalize(statement)
+    # bound the number of series; ad-hoc statements share one bucket
+    if (key,) not in QUERY_SECONDS.children and len(QUERY_SECONDS.children) >= MAX_TRACKED_STATEMENTS:
+        key = OTHER_STATEMENTS
+    return QUERY_SECONDS.labels(key)
+
+
+def query_stats():
+    return {labels[0]: histogram.snapshot() for labels, histogram in list(QUERY_SECONDS.children.items())}
+
+
+def instrument_engine(engine, slow_query_ms=100.0, sample_rate=0.0):
+    _start_queue_logging()
+    slow_query_seconds = slow_query_ms / 1000.0
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def record_timing(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        _histogram_for(statement).observe(elapsed)
+        slow = elapsed >= slow_query_seconds
+        if slow or (sample_rate and random.random() < sample_rate):
+            logger.info(json.dumps({
+                "event": "slow_query" if slow else "sampled_query",
+                "duration_ms": round(elapsed * 1000, 3),
+                "executemany": executemany,
+                "statement": _normalize(statement),
+            }))
+
+    @event.listens_for(engine, "handle_error")
+    def discard_timer(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start_time"):
+            conn.info["query_start_time"].pop()
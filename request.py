@@ -1,9 +1,17 @@
+import sys
+import uuid
+
 import requests
 
+import client
+
 BASE_URL = "http://127.0.0.1:8073" 
 
+# one pooled keep-alive connection for the whole session
+session = client.make_session()
+
 def get_root():
-    response = requests.get(f"{BASE_URL}/")
+    response = session.get(f"{BASE_URL}/")
     print("GET / Response:")
     print(response.json())
 
@@ -18,18 +26,42 @@ def create_booking():
         "service_type": service_type,
         "booking_date": booking_date
     }
-    response = requests.post(f"{BASE_URL}/bookings/", json=payload)
+    # Retries of this request reuse the key, so they can't create a second booking
+    response = session.post(f"{BASE_URL}/bookings/", json=payload, headers={"Idempotency-Key": str(uuid.uuid4())})
     print("POST /bookings/ Response:")
     print(response.json())
 
 def get_all_bookings():
-    response = requests.get(f"{BASE_URL}/bookings/get-all/")
+    # Follow the keyset cursor until the server stops returning one
+    bookings = []
+    params = {"limit": 1000}
+    while True:
+        response = session.get(f"{BASE_URL}/bookings/get-all/", params=params)
+        bookings.extend(response.json())
+        next_after_id = response.headers.get("X-Next-After-Id")
+        if not next_after_id:
+            break
+        params["after_id"] = next_after_id
     print("GET /bookings/ Response:")
+    print(bookings)
+
+def search_bookings():
+    print("Leave a filter blank to skip it.")
+    filters = {
+        "from": input("Enter from date (YYYY-MM-DD): ").strip(),
+        "to": input("Enter to date (YYYY-MM-DD): ").strip(),
+        "vehicle_name": input("Enter vehicle number: ").strip(),
+        "customer_name": input("Enter customer name prefix: ").strip(),
+        "service_type": input("Enter service type: ").strip(),
+    }
+    params = {key: value for key, value in filters.items() if value}
+    response = session.get(f"{BASE_URL}/bookings/search", params=params)
+    print("GET /bookings/search Response:")
     print(response.json())
 
 def get_booking_by_id():
     booking_id = input("Enter booking ID: ")
-    response = requests.get(f"{BASE_URL}/bookings/{booking_id}")
+    response = session.get(f"{BASE_URL}/bookings/{booking_id}")
     print(f"GET /bookings/{booking_id} Response:")
     if response.status_code == 200:
         print(response.json())
@@ -63,7 +95,7 @@ def update_booking():
         return
 
     # Send the PUT request with the partial payload
-    response = requests.put(f"{BASE_URL}/bookings/{booking_id}", json=payload)
+    response = session.put(f"{BASE_URL}/bookings/{booking_id}", json=payload)
     print(f"PUT /bookings/{booking_id} Response:")
     
     # Handle the response
@@ -74,7 +106,7 @@ def update_booking():
 
 def delete_booking():
     booking_id = input("Enter booking ID to delete: ")
-    response = requests.delete(f"{BASE_URL}/bookings/{booking_id}")
+    response = session.delete(f"{BASE_URL}/bookings/{booking_id}")
     print(f"DELETE /bookings/{booking_id} Response:")
     if response.status_code == 204:  # No Content
         print("Booking deleted successfully.")
@@ -93,7 +125,8 @@ def main():
         print("4. Get a booking by ID")
         print("5. Update a booking")
         print("6. Delete a booking")
-        print("7. Exit")
+        print("7. Search bookings")
+        print("8. Exit")
         
         choice = input("Enter your choice: ")
         
@@ -110,10 +143,15 @@ def main():
         elif choice == "6":
             delete_booking()
         elif choice == "7":
+            search_bookings()
+        elif choice == "8":
             print("Exiting the application. Goodbye!")
             break
         else:
             print("Invalid choice. Please try again.")
 
 if __name__ == "__main__":
+    # with arguments run non-interactively, see client.py
+    if len(sys.argv) > 1:
+        sys.exit(client.main(sys.argv[1:], BASE_URL))
     main()
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""Per-day, per-service_type booking counts for GET /reports/bookings.
+
+The write endpoints add their deltas to the rollup table in the same
+transaction as the booking change, so reports read O(days x service types)
+rows instead of scanning the bookings. Given bay capacities, the same
+upsert refuses to take a slot over capacity, which makes it the capacity
+check that holds across worker processes. Archiving moves bookings between
+tables without changing the counts, so reports cover archived days too.
+
+    python rollup.py        # recount everything, e.g. after writes that bypassed main.py
+"""
+import argparse
+from collections import Counter
+
+from sqlalchemy import delete, func, insert, select, union_all
+
+from availability import SlotUnavailable
+from database import upsert_insert
+
+GROUP_COLUMNS = ("booking_date", "service_type")
+
+
+def slot_deltas(added=(), removed=()):
+    """Counter of (booking_date, service_type) -> change in bookings."""
+    deltas = Counter(added)
+    deltas.subtract(Counter(removed))
+    return deltas
+
+
+def apply_deltas(db, rollup, deltas, capacity=None):
+    """Add deltas to the rollup inside the caller's transaction.
+
+    With capacity (service_type -> bays), a slot that would go over it
+    raises SlotUnavailable; the caller rolls the transaction back.
+    """
+    rows = [
+        {"booking_date": booking_date, "service_type": service_type, "bookings": change}
+        for (booking_date, service_type), change in deltas.items() if change
+    ]
+    if not rows:
+        return
+    statement = upsert_insert(db.get_bind(), rollup)
+    index_elements = [rollup.c.booking_date, rollup.c.service_type]
+    total = rollup.c.bookings + statement.excluded.bookings
+    if capacity is None:
+        db.execute(statement.on_conflict_do_update(index_elements=index_elements, set_={"bookings": total}), rows)
+        return
+    released = [row for row in rows if row["bookings"] < 0]
+    if released:
+        db.execute(statement.on_conflict_do_update(index_elements=index_elements, set_={"bookings": total}), released)
+    for row in rows:
+        if row["bookings"] < 0:
+            continue
+        limit = capacity(row["service_type"])
+        if row["bookings"] > limit:
+            raise SlotUnavailable(row["booking_date"], row["service_type"])
+        # the row lock taken by the upsert serializes concurrent writers to
+        # the slot; a refused update returns no row
+        booked = db.execute(
+            statement.values(**row)
+            .on_conflict_do_update(index_elements=index_elements, set_={"bookings": total}, where=total <= limit)
+            .returning(rollup.c.bookings)
+        ).first()
+        if booked is None:
+            raise SlotUnavailable(row["booking_date"], row["service_type"])
+
+
+def is_empty(session_factory, rollup):
+    with session_factory() as db:
+        return db.execute(select(rollup.c.booking_date).limit(1)).first() is None
+
+
+def rebuild_rollup(session_factory, rollup, tables):
+    """Recount the rollup from the booking tables in one transaction."""
+    slots = union_all(*(select(table.c.booking_date, table.c.service_type) for table in tables)).subquery()
+    counts = (
+        select(slots.c.booking_date, slots.c.service_type, func.count())
+        .group_by(slots.c.booking_date, slots.c.service_type)
+    )
+    with session_factory() as db:
+        db.execute(delete(rollup))
+        db.execute(insert(rollup).from_select(["booking_date", "service_type", "bookings"], counts))
+        db.commit()
+
+
+def bookings_report(db, rollup, date_from=None, date_to=None, group_by=GROUP_COLUMNS, service_type=None):
+    columns = [rollup.c[name] for name in group_by]
+    total = func.sum(rollup.c.bookings).label("bookings")
+    statement = select(*columns, total)
+    if date_from is not None:
+        statement = statement.where(rollup.c.booking_date >= date_from)
+    if date_to is not None:
+        statement = statement.where(rollup.c.booking_date <= date_to)
+    if service_type is not None:
+        statement = statement.where(rollup.c.service_type == service_type)
+    statement = statement.group_by(*columns).having(total > 0).order_by(*columns)
+    return [dict(zip([*group_by, "bookings"], row)) for row in db.execute(statement)]
+
+
+def main(argv=None):
+    argparse.ArgumentParser(description="Recount the booking rollup table").parse_args(argv)
+
+    import main as app_module
+
+    app_module.migrate()
+    rollup = app_module.BookingDailyRollup.__table__
+    rebuild_rollup(
+        app_module.SessionLocal,
+        rollup,
+        (app_module.ServiceBooking.__table__, app_module.ServiceBookingArchive.__table__),
+    )
+    with app_module.SessionLocal() as db:
+        rows, total = db.execute(select(func.count(), func.sum(rollup.c.bookings))).one()
+    print(f"rebuilt {rows} rollup rows covering {total or 0} bookings")
+
+
+if __name__ == "__main__":
+    main()
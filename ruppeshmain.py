@@ -1,14 +1,21 @@
-from sqlalchemy import Column, Integer, String, create_engine, Date
-from fastapi import FastAPI, status, HTTPException, Depends
+from sqlalchemy import Column, Integer, String, Date
+from fastapi import FastAPI, status, HTTPException, Depends, Header, Response
 from pydantic import BaseModel
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
+from sqlalchemy.exc import IntegrityError
 from datetime import date
 from typing import Optional
+import json
+
+from database import get_settings, make_engine
+from idempotency import IdempotencyStore, IdempotencyKeyReused
+from models import idempotency_keys_table
 
 # Create app
 app = FastAPI()
 
-engine = create_engine("sqlite:///./service_center.db", echo=True)
+settings = get_settings()
+engine = make_engine(settings)
 Base = declarative_base()
 SessionLocal = sessionmaker(autocommit=False, bind=engine)
 
@@ -21,7 +28,15 @@ class ServiceBooking(Base):
     service_type = Column(String, nullable=False)
     booking_date = Column(Date, nullable=False)
 
-Base.metadata.create_all(bind=engine)
+# Responses of POST /bookings/ by Idempotency-Key
+idempotency_store = IdempotencyStore(idempotency_keys_table(Base.metadata))
+
+def migrate():
+    Base.metadata.create_all(bind=engine)
+
+# serve.py migrates once before starting workers and sets AUTO_MIGRATE=0
+if settings.auto_migrate:
+    migrate()
 
 # Pydantic model
 class ServiceBookingCreate(BaseModel):
@@ -36,6 +51,28 @@ class ServiceBookingUpdate(BaseModel):
     service_type: Optional[str] = None
     booking_date: Optional[date] = None
 
+def booking_to_dict(booking):
+    return {
+        "id": booking.id,
+        "customer_name": booking.customer_name,
+        "vehicle_number": booking.vehicle_number,
+        "service_type": booking.service_type,
+        "booking_date": booking.booking_date.isoformat(),
+    }
+
+def replay_idempotent(db, idempotency_key, fingerprint):
+    try:
+        stored = idempotency_store.lookup(db, idempotency_key, fingerprint)
+    except IdempotencyKeyReused as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    if stored is None:
+        return None
+    status_code, body = stored
+    return Response(content=body, status_code=status_code, media_type="application/json", headers={"Idempotent-Replayed": "true"})
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -45,7 +82,13 @@ def get_db():
         db.close()
 
 @app.post("/bookings/")
-def create_booking(booking: ServiceBookingCreate, db: Session = Depends(get_db)):
+def create_booking(booking: ServiceBookingCreate, idempotency_key: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    # A retry of a request that already succeeded gets the original response
+    if idempotency_key is not None:
+        fingerprint = idempotency_store.fingerprint("POST /bookings/", booking.dict())
+        replay = replay_idempotent(db, idempotency_key, fingerprint)
+        if replay is not None:
+            return replay
     try:
         # Validate booking date
         if booking.booking_date < date.today():
@@ -55,9 +98,23 @@ def create_booking(booking: ServiceBookingCreate, db: Session = Depends(get_db))
             )
         new_booking = ServiceBooking(**booking.dict())
         db.add(new_booking)
-        db.commit()
-        db.refresh(new_booking)
-        return new_booking
+        if idempotency_key is None:
+            db.commit()
+            db.refresh(new_booking)
+            return new_booking
+        try:
+            db.flush()
+            body = json.dumps(booking_to_dict(new_booking)).encode()
+            idempotency_store.save(db, idempotency_key, fingerprint, status.HTTP_200_OK, body)
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            # A concurrent request with the same key committed first
+            replay = replay_idempotent(db, idempotency_key, fingerprint)
+            if replay is not None:
+                return replay
+            raise
+        return Response(content=body, status_code=status.HTTP_200_OK, media_type="application/json")
     except HTTPException as e:
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred while creating the booking: {str(e)}"
@@ -0,0 +1,101 @@
+"""Run a booking app under uvicorn.
+
+    python serve.py                                  # main:app on 127.0.0.1:8073
+    python serve.py --app vehicle --workers 4 --host 0.0.0.0
+    python serve.py migrate --app vehicle            # only create/alter tables
+
+The schema is migrated once in this process before any worker starts, and
+the workers run with AUTO_MIGRATE=0 so they never race each other on DDL at
+boot. uvloop and httptools are used when installed.
+
+The booking cache (memory://) and event bus live in each worker process.
+Bay capacity and GET /availability come from the rollup table, in the
+booking's transaction (see rollup.py), so they hold across workers.
+"""
+import argparse
+import importlib
+import importlib.util
+import os
+import sys
+
+APPS = ("main", "vehicle", "asyncmain", "ruppeshmain")
+# ports request.py and ruppeshrequest.py talk to
+DEFAULT_PORTS = {"main": 8073, "vehicle": 8073, "asyncmain": 8073, "ruppeshmain": 8065}
+# asyncmain serves main.py's tables
+SCHEMA_MODULES = {"asyncmain": "main"}
+
+
+def migrate(app_name):
+    # imported with AUTO_MIGRATE=0 so the import itself runs no DDL
+    os.environ["AUTO_MIGRATE"] = "0"
+    module = importlib.import_module(SCHEMA_MODULES.get(app_name, app_name))
+    module.migrate()
+    module.engine.dispose()
+
+
+def serve(args):
+    import uvicorn
+
+    if not args.skip_migrate:
+        migrate(args.app)
+    os.environ["AUTO_MIGRATE"] = "0"
+    loop = "uvloop" if args.loop == "auto" and importlib.util.find_spec("uvloop") else args.loop
+    http = "httptools" if args.http == "auto" and importlib.util.find_spec("httptools") else args.http
+    print(
+        f"serving {args.app}:app on {args.host}:{args.port} with {args.workers} worker(s), loop={loop}, http={http}",
+        file=sys.stderr,
+    )
+    uvicorn.run(
+        f"{args.app}:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=loop,
+        http=http,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_concurrency=args.limit_concurrency,
+        access_log=args.access_log,
+    )
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # "run" is the default command
+    if not argv or argv[0].startswith("-"):
+        argv = ["run"] + argv
+    parser = argparse.ArgumentParser(description="Run a booking app under uvicorn")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="migrate, then serve with uvicorn workers")
+    run.add_argument("--app", choices=APPS, default="main")
+    run.add_argument("--host", default=os.environ.get("HOST", "127.0.0.1"))
+    run.add_argument("--port", type=int, default=None, help="defaults to PORT, or the port the clients use")
+    run.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", "1")))
+    run.add_argument("--loop", choices=("auto", "asyncio", "uvloop"), default="auto")
+    run.add_argument("--http", choices=("auto", "h11", "httptools"), default="auto")
+    run.add_argument("--backlog", type=int, default=2048, help="listen backlog for connection bursts")
+    run.add_argument("--keep-alive", type=int, default=30, help="idle keep-alive timeout in seconds")
+    run.add_argument("--graceful-timeout", type=int, default=30,
+                     help="seconds to let in-flight requests finish on shutdown")
+    run.add_argument("--limit-concurrency", type=int, default=None,
+                     help="per-worker cap on concurrent connections, beyond it requests get 503")
+    run.add_argument("--access-log", action="store_true")
+    run.add_argument("--skip-migrate", action="store_true", help="don't run the migrate step first")
+
+    migrate_cmd = commands.add_parser("migrate", help="create or alter the app's tables and exit")
+    migrate_cmd.add_argument("--app", choices=APPS, default="main")
+
+    args = parser.parse_args(argv)
+    if args.command == "migrate":
+        migrate(args.app)
+        print(f"migrated {SCHEMA_MODULES.get(args.app, args.app)} schema", file=sys.stderr)
+        return
+    if args.port is None:
+        args.port = int(os.environ.get("PORT", DEFAULT_PORTS[args.app]))
+    serve(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, insert, select
+
+from database import Settings
+from writebatch import GroupCommitWriter, make_writer_engine
+
+metadata = MetaData()
+items = Table(
+    "items",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String, nullable=False, unique=True),
+)
+
+
+@pytest.fixture
+def writer(tmp_path):
+    engine = make_writer_engine(Settings(database_url=f"sqlite:///{tmp_path / 'writes.db'}"))
+    metadata.create_all(engine)
+    writer = GroupCommitWriter(engine, max_batch=16, max_delay=0.05)
+    yield writer
+    if not writer._closed:
+        writer.close()
+
+
+def add(name):
+    def write(session):
+        return session.execute(insert(items).values(name=name).returning(items.c.id)).scalar()
+    return write
+
+
+def fail(name, error):
+    def write(session):
+        session.execute(insert(items).values(name=name))
+        raise error
+    return write
+
+
+class Hold:
+    """Keep the writer thread busy in a batch until released, so later writes queue up."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.entered = threading.Event()
+        self.released = threading.Event()
+        self.thread = threading.Thread(target=writer.submit, args=(self.gate,))
+        self.thread.start()
+        self.entered.wait()
+
+    def gate(self, session):
+        self.entered.set()
+        self.released.wait()
+
+    def wait_queued(self, count):
+        while self.writer._queue.qsize() < count:
+            time.sleep(0.01)
+
+    def release(self):
+        self.released.set()
+        self.thread.join()
+
+
+def submit_in_one_batch(writer, writes):
+    """Submit writes so they are flushed together; returns each one's result or exception."""
+    outcomes = [None] * len(writes)
+
+    def run(index):
+        try:
+            outcomes[index] = writer.submit(writes[index])
+        except Exception as e:
+            outcomes[index] = e
+
+    hold = Hold(writer)
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(len(writes))]
+    for thread in threads:
+        thread.start()
+    hold.wait_queued(len(writes))
+    hold.release()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def names(writer):
+    with writer.engine.connect() as conn:
+        return set(conn.execute(select(items.c.name)).scalars())
+
+
+def test_single_write_commits(writer):
+    booking_id = writer.submit(add("a"))
+    assert booking_id == 1
+    assert names(writer) == {"a"}
+
+
+def test_failed_write_is_rolled_back_alone(writer):
+    writes = [add("a"), fail("b", ValueError("b failed")), add("c"), add("a")]
+    outcomes = submit_in_one_batch(writer, writes)
+    assert isinstance(outcomes[1], ValueError)
+    # the duplicate loses on the UNIQUE; whichever "a" ran second gets the error
+    assert sum(isinstance(outcome, Exception) for outcome in outcomes) == 2
+    assert names(writer) == {"a", "c"}
+
+
+def test_each_caller_gets_its_own_error(writer):
+    errors = [ValueError("first"), KeyError("second"), RuntimeError("third")]
+    writes = [fail(f"x{index}", error) for index, error in enumerate(errors)] + [add("ok")]
+    outcomes = submit_in_one_batch(writer, writes)
+    assert outcomes[:3] == errors
+    assert isinstance(outcomes[3], int)
+    assert names(writer) == {"ok"}
+
+
+def test_close_commits_queued_writes(writer):
+    hold = Hold(writer)
+    queued = [threading.Thread(target=writer.submit, args=(add(f"q{index}"),)) for index in range(5)]
+    for thread in queued:
+        thread.start()
+    hold.wait_queued(5)
+    closing = threading.Thread(target=writer.close)
+    closing.start()
+    hold.release()
+    for thread in [closing, *queued]:
+        thread.join()
+    assert names(writer) == {f"q{index}" for index in range(5)}
+
+
+def test_submit_after_close_fails(writer):
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.submit(add("late"))
+
+
+def test_submit_racing_close_never_hangs(writer):
+    outcomes = []
+
+    def run(index):
+        try:
+            outcomes.append(writer.submit(add(f"r{index}")))
+        except RuntimeError as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(50)]
+    for thread in threads[:25]:
+        thread.start()
+    writer.close()
+    for thread in threads[25:]:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert not any(thread.is_alive() for thread in threads)
+    committed = [outcome for outcome in outcomes if isinstance(outcome, int)]
+    assert len(outcomes) == 50
+    assert len(names(writer)) == len(committed)
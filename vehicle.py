@@ -1,26 +1,86 @@
-from fastapi import FastAPI, HTTPException, status, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, status, Depends, Query, Response, Header
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from sqlalchemy import Column, Integer, String, Date, create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import bindparam, inspect, select, update
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.exc import IntegrityError
+from contextlib import asynccontextmanager
 from datetime import date
+from typing import Optional
+import json
 
-# Database setup
-DATABASE_URL = "sqlite:///./service_center.db"
-Base = declarative_base()
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+from database import get_settings, make_engine, sync_schema, drain_sessions, rebuild_table
+from directory import normalize_plate
+from idempotency import IdempotencyStore, IdempotencyKeyReused
+from metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, track_session
+from models import VehicleBase as Base, VehicleServiceBooking as ServiceBooking, VehicleIdempotencyKeys
 
-# FastAPI app instance
-app = FastAPI()
+# Database setup, bound by init_db() from the lifespan
+engine = None
+engine_settings = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+def init_db(settings=None):
+    """Bind SessionLocal to an engine for settings; without settings, reuse the current one."""
+    global engine, engine_settings
+    if settings is None:
+        if engine is not None:
+            return engine
+        settings = get_settings()
+    # An app created with other settings gets its own engine, not the last app's
+    if engine is None or settings != engine_settings:
+        if engine is not None:
+            engine.dispose()
+        engine = make_engine(settings)
+        engine_settings = settings
+        SessionLocal.configure(bind=engine)
+    return engine
+
+def migrate():
+    sync_schema(Base.metadata, init_db())
+    # Tables from when vehicle_number was unique would still refuse repeat visits
+    if vehicle_number_unique():
+        rebuild_table(engine, ServiceBooking.__table__)
+    backfill_plates()
+
+def vehicle_number_unique():
+    inspector = inspect(engine)
+    table = ServiceBooking.__tablename__
+    unique = inspector.get_unique_constraints(table) + [
+        index for index in inspector.get_indexes(table) if index["unique"]
+    ]
+    return any(entry["column_names"] == ["vehicle_number"] for entry in unique)
+
+def backfill_plates(batch_size=1000):
+    # Rows written before the plate column existed
+    table = ServiceBooking.__table__
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.vehicle_number).where(table.c.plate.is_(None)).limit(batch_size)
+            ).all()
+            if not rows:
+                return
+            conn.execute(
+                update(table).where(table.c.id == bindparam("row_id")).values(plate=bindparam("new_plate")),
+                [{"row_id": row.id, "new_plate": normalize_plate(row.vehicle_number)} for row in rows],
+            )
+
+@asynccontextmanager
+async def lifespan(app):
+    # The engine and schema checks are set up here rather than at import time
+    settings = app.state.settings or get_settings()
+    init_db(settings)
+    if settings.auto_migrate:
+        await run_in_threadpool(migrate)
+    yield
+    # Let in-flight requests finish with their sessions before closing the pool
+    await drain_sessions(engine)
 
-# SQLAlchemy model
-class ServiceBooking(Base):
-    __tablename__ = "service_bookings"
-    id = Column(Integer, primary_key=True, index=True)
-    customer_name = Column(String, nullable=False)
-    vehicle_number = Column(String, nullable=False, unique=True)
-    service_type = Column(String, nullable=False)
-    booking_date = Column(Date, nullable=False)
+# Routes are collected here and mounted by create_app()
+router = APIRouter()
 
 # Pydantic model for request validation
 class ServiceBookingCreate(BaseModel):
@@ -29,44 +89,164 @@ class ServiceBookingCreate(BaseModel):
     service_type: str = Field(..., example="Oil Change")
     booking_date: date = Field(..., example="2023-12-15")
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Pydantic model for partial updates
+class ServiceBookingUpdate(BaseModel):
+    customer_name: Optional[str] = None
+    vehicle_number: Optional[str] = None
+    service_type: Optional[str] = None
+    booking_date: Optional[date] = None
+
+# Responses of POST /bookings/ by Idempotency-Key
+idempotency_store = IdempotencyStore(VehicleIdempotencyKeys)
+
+# Rows fetched per round trip when streaming
+STREAM_CHUNK_SIZE = 1000
+
+def booking_to_dict(booking):
+    return {
+        "id": booking.id,
+        "customer_name": booking.customer_name,
+        "vehicle_number": booking.vehicle_number,
+        "service_type": booking.service_type,
+        "booking_date": booking.booking_date.isoformat(),
+        "version": booking.version,
+    }
+
+def iter_bookings_ndjson(after_id=None, chunk_size=STREAM_CHUNK_SIZE):
+    # Keyset walk over the primary key with a short-lived session per chunk
+    last_id = after_id or 0
+    while True:
+        db = SessionLocal()
+        try:
+            chunk = (
+                db.query(ServiceBooking)
+                .filter(ServiceBooking.id > last_id)
+                .order_by(ServiceBooking.id)
+                .limit(chunk_size)
+                .all()
+            )
+            lines = "".join(json.dumps(booking_to_dict(b)) + "\n" for b in chunk)
+        finally:
+            db.close()
+        if not chunk:
+            return
+        last_id = chunk[-1].id
+        yield lines
+        if len(chunk) < chunk_size:
+            return
+
+def replay_idempotent(db, idempotency_key, fingerprint):
+    try:
+        stored = idempotency_store.lookup(db, idempotency_key, fingerprint)
+    except IdempotencyKeyReused as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    if stored is None:
+        return None
+    status_code, body = stored
+    return Response(content=body, status_code=status_code, media_type="application/json", headers={"Idempotent-Replayed": "true"})
+
+def booking_modified():
+    # The ORM write is guarded by the version it loaded (version_id_col), so
+    # losing a race to another write is a conflict rather than a 500
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Booking was modified by another request."
+    )
 
 # Dependency to get DB session
 def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    yield from track_session(SessionLocal)
 
 # Root endpoint
-@app.get("/")
+@router.get("/")
 def read_root():
     return {"message": "Welcome to the Vehicle Service Centre API"}
 
+# Prometheus metrics
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 # API Endpoints
 
-@app.post("/bookings/", status_code=status.HTTP_201_CREATED)
-def create_booking(booking: ServiceBookingCreate, db: SessionLocal = Depends(get_db)):
+@router.post("/bookings/", status_code=status.HTTP_201_CREATED)
+def create_booking(
+    booking: ServiceBookingCreate,
+    idempotency_key: Optional[str] = Header(None),
+    db: SessionLocal = Depends(get_db),
+):
+    # A retry of a request that already succeeded gets the original response
+    if idempotency_key is not None:
+        fingerprint = idempotency_store.fingerprint("POST /bookings/", booking.dict())
+        replay = replay_idempotent(db, idempotency_key, fingerprint)
+        if replay is not None:
+            return replay
     # Validate booking date
     if booking.booking_date < date.today():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Booking date cannot be in the past."
         )
-    new_booking = ServiceBooking(**booking.dict())
+    new_booking = ServiceBooking(**booking.dict(), plate=normalize_plate(booking.vehicle_number))
     db.add(new_booking)
-    db.commit()
-    db.refresh(new_booking)
-    return new_booking
+    try:
+        db.flush()
+        body = json.dumps(booking_to_dict(new_booking)).encode()
+        if idempotency_key is not None:
+            idempotency_store.save(db, idempotency_key, fingerprint, status.HTTP_201_CREATED, body)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        # A concurrent request with the same key committed first
+        replay = replay_idempotent(db, idempotency_key, fingerprint) if idempotency_key is not None else None
+        if replay is not None:
+            return replay
+        raise
+    return Response(content=body, status_code=status.HTTP_201_CREATED, media_type="application/json")
+
+@router.get("/bookings/", status_code=status.HTTP_200_OK)
+def get_all_bookings(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = Query(None, ge=0),
+    stream: bool = False,
+    db: SessionLocal = Depends(get_db),
+):
+    # stream=true returns every booking after after_id as NDJSON
+    if stream:
+        return StreamingResponse(iter_bookings_ndjson(after_id), media_type="application/x-ndjson")
+    query = db.query(ServiceBooking)
+    if after_id is not None:
+        query = query.filter(ServiceBooking.id > after_id)
+    bookings = query.order_by(ServiceBooking.id).limit(limit).all()
+    # Cursor for the next page; absent on the last page
+    if len(bookings) == limit:
+        response.headers["X-Next-After-Id"] = str(bookings[-1].id)
+    return [booking_to_dict(booking) for booking in bookings]
 
-@app.get("/bookings/", status_code=status.HTTP_200_OK)
-def get_all_bookings(db: SessionLocal = Depends(get_db)):
-    bookings = db.query(ServiceBooking).all()
-    return bookings
+@router.get("/vehicles/{vehicle_number}/bookings", status_code=status.HTTP_200_OK)
+def get_vehicle_bookings(
+    vehicle_number: str,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = Query(None, ge=0),
+    db: SessionLocal = Depends(get_db),
+):
+    # Service history of one vehicle through the plate index; "ka-01 ab 1234"
+    # finds the bookings made as "KA01AB1234"
+    query = db.query(ServiceBooking).filter(ServiceBooking.plate == normalize_plate(vehicle_number))
+    if after_id is not None:
+        query = query.filter(ServiceBooking.id > after_id)
+    bookings = query.order_by(ServiceBooking.id).limit(limit).all()
+    # Cursor for the next page; absent on the last page
+    if len(bookings) == limit:
+        response.headers["X-Next-After-Id"] = str(bookings[-1].id)
+    return [booking_to_dict(booking) for booking in bookings]
 
-@app.get("/bookings/{booking_id}", status_code=status.HTTP_200_OK)
+@router.get("/bookings/{booking_id}", status_code=status.HTTP_200_OK)
 def get_booking_by_id(booking_id: int, db: SessionLocal = Depends(get_db)):
     booking = db.query(ServiceBooking).filter(ServiceBooking.id == booking_id).first()
     if not booking:
@@ -74,9 +254,9 @@ def get_booking_by_id(booking_id: int, db: SessionLocal = Depends(get_db)):
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Booking not found."
         )
-    return booking
+    return booking_to_dict(booking)
 
-@app.put("/bookings/{booking_id}", status_code=status.HTTP_200_OK)
+@router.put("/bookings/{booking_id}", status_code=status.HTTP_200_OK)
 def update_booking(booking_id: int, updated_booking: ServiceBookingCreate, db: SessionLocal = Depends(get_db)):
     booking = db.query(ServiceBooking).filter(ServiceBooking.id == booking_id).first()
     if not booking:
@@ -92,11 +272,81 @@ def update_booking(booking_id: int, updated_booking: ServiceBookingCreate, db: S
         )
     for key, value in updated_booking.dict().items():
         setattr(booking, key, value)
-    db.commit()
+    booking.plate = normalize_plate(booking.vehicle_number)
+    try:
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        raise booking_modified()
     db.refresh(booking)
-    return booking
+    return booking_to_dict(booking)
+
+def parse_if_match(if_match):
+    # Expected version, or None when any version is acceptable
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="If-Match must be a booking version ETag."
+        )
 
-@app.delete("/bookings/{booking_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.patch("/bookings/{booking_id}", status_code=status.HTTP_200_OK)
+def patch_booking(
+    booking_id: int,
+    changes: ServiceBookingUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: SessionLocal = Depends(get_db),
+):
+    values = changes.dict(exclude_none=True)
+    if not values:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No fields to update."
+        )
+    # Validate booking date
+    if "booking_date" in values and values["booking_date"] < date.today():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Booking date cannot be in the past."
+        )
+    if "vehicle_number" in values:
+        values["plate"] = normalize_plate(values["vehicle_number"])
+    expected_version = parse_if_match(if_match)
+    # Single UPDATE ... RETURNING instead of SELECT, UPDATE and refresh
+    statement = (
+        update(ServiceBooking)
+        .where(ServiceBooking.id == booking_id)
+        .values(**values, version=ServiceBooking.version + 1)
+        .returning(*ServiceBooking.__table__.c)
+        .execution_options(synchronize_session=False)
+    )
+    if expected_version is not None:
+        statement = statement.where(ServiceBooking.version == expected_version)
+    booking = db.execute(statement).first()
+    if booking is None:
+        exists = db.query(ServiceBooking.id).filter(ServiceBooking.id == booking_id).first()
+        db.rollback()
+        if exists:
+            raise HTTPException(
+                status_code=status.HTTP_412_PRECONDITION_FAILED,
+                detail="Booking was modified by another request."
+            )
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Booking not found."
+        )
+    db.commit()
+    response.headers["ETag"] = f'"{booking.version}"'
+    return booking_to_dict(booking)
+
+@router.delete("/bookings/{booking_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_booking(booking_id: int, db: SessionLocal = Depends(get_db)):
     booking = db.query(ServiceBooking).filter(ServiceBooking.id == booking_id).first()
     if not booking:
@@ -105,5 +355,20 @@ def delete_booking(booking_id: int, db: SessionLocal = Depends(get_db)):
             detail="Booking not found."
         )
     db.delete(booking)
-    db.commit()
+    try:
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        raise booking_modified()
     return {"detail": "Booking deleted successfully."}
+
+# FastAPI app instance
+def create_app(settings=None):
+    app = FastAPI(lifespan=lifespan)
+    # Read by the lifespan; None means get_settings() at startup
+    app.state.settings = settings
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(router)
+    return app
+
+app = create_app()
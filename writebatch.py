@@ -0,0 +1,132 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import replace
+
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from database import make_engine
+from metrics import DB_GROUP_COMMIT_BATCH
+
+# Group commit for main.py's write endpoints (GROUP_COMMIT=1). Request threads
+# hand their write to one writer thread, which runs whatever arrived within
+# a couple of milliseconds as one transaction: one fsync and one write lock
+# per batch instead of per request. Each write runs in its own SAVEPOINT, so
+# a write that fails (a constraint, a version conflict) is rolled back alone
+# and only its caller sees the error.
+#
+#   GROUP_COMMIT_MAX_BATCH=64      writes per transaction at most
+#   GROUP_COMMIT_DELAY_MS=2        how long the first write waits for company
+
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_DELAY = 0.002
+
+
+def make_writer_engine(settings):
+    """Engine with the one connection the writer thread needs."""
+    engine = make_engine(replace(settings, pool_size=1, max_overflow=0))
+    if settings.is_sqlite:
+        # pysqlite's own BEGIN handling breaks SAVEPOINT, so SQLAlchemy emits it instead
+        @event.listens_for(engine, "connect")
+        def disable_pysqlite_transactions(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, "begin")
+        def begin_immediate(conn):
+            # take the write lock up front rather than upgrading a read lock mid-batch
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+    return engine
+
+
+class GroupCommitWriter:
+    def __init__(self, engine, max_batch=DEFAULT_MAX_BATCH, max_delay=DEFAULT_MAX_DELAY):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._sessions = sessionmaker(bind=engine, autocommit=False)
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        # held while checking _closed and queueing, so nothing is queued behind close()'s sentinel
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, write):
+        """Run write(session) in the next batch; returns its result once committed, or raises its error."""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("group-commit writer is closed")
+            self._queue.put((write, future))
+        return future.result()
+
+    def close(self):
+        """Commit what is queued, stop the thread and dispose the engine; for lifespan shutdown."""
+        with self._lock:
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+        self.engine.dispose()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if batch:
+                self._flush(batch)
+
+    def _collect(self):
+        """Next batch of (write, future), and whether close() was called."""
+        item = self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _flush(self, batch):
+        done = []
+        try:
+            with self._sessions() as session:
+                if len(batch) == 1:
+                    # nothing to isolate it from, skip the SAVEPOINT round trips
+                    write, future = batch[0]
+                    try:
+                        done.append((future, write(session)))
+                    except Exception as e:
+                        session.rollback()
+                        future.set_exception(e)
+                else:
+                    for write, future in batch:
+                        savepoint = session.begin_nested()
+                        try:
+                            result = write(session)
+                            savepoint.commit()
+                        except Exception as e:
+                            savepoint.rollback()
+                            future.set_exception(e)
+                        else:
+                            done.append((future, result))
+                if done:
+                    session.commit()
+        except Exception as e:
+            # the commit itself failed, so none of the batch was written
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            DB_GROUP_COMMIT_BATCH.observe(len(batch))
+        for future, result in done:
+            future.set_result(result)